@@ -0,0 +1,141 @@
+# autotune.py
+import argparse, itertools, os, shutil, tempfile, time
+from concurrent.futures import wait
+from pathlib import Path
+
+import fitz
+
+from corpus_utils import iter_corpus
+from pdf_extractor import make_pool, run_jobs
+from storage.ImageWriters import MemoryImageWriter
+from tuning import DEFAULT_PROFILE, DEFAULT_SETTINGS, save_profile
+from weights_utils import ensure_yolo_weights
+from yolo_model.YoloModel import DEFAULT_WEIGHTS, get_model
+
+
+def _int_list(s):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def _pid():
+    time.sleep(0.2)
+    return os.getpid()
+
+
+def _warm_pool(pool, workers, rounds=20):
+    # Workers load the model in their initializer; wait until every one of them has answered.
+    seen = set()
+    for _ in range(rounds):
+        futs = [pool.submit(_pid) for _ in range(workers)]
+        wait(futs)
+        seen.update(f.result() for f in futs)
+        if len(seen) >= workers:
+            return
+
+
+def default_grid(cores):
+    workers = [w for w in (1, 2, 4, 8, 16, 32) if w <= cores]
+    for w in workers:
+        for t in sorted({max(1, cores // w), max(1, cores // (2 * w))}):
+            yield w, t
+
+
+def _runtime_state():
+    # CPU affinity and torch threads of this process; a single-worker run applies its settings here.
+    import torch
+    cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+    return cpus, torch.get_num_threads()
+
+
+def _restore_runtime(state):
+    import torch
+    cpus, threads = state
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+
+
+def benchmark(sample, workers, torch_threads, batch_size, render_scale, pin_cpus, weights_path=DEFAULT_WEIGHTS):
+    # The benchmarked model is the one the profile is recorded for: preloaded and used for every page.
+    # The affinity and thread count are restored afterwards, so a pinned single-worker run doesn't leave
+    # later configurations (and the pools they start) with a fraction of the cores.
+    state = _runtime_state()
+    temp_dir = Path(tempfile.mkdtemp(prefix="__tune_tmp__"))
+    options = {"batch_size": batch_size, "render_scale": render_scale, "weights_path": weights_path}
+    pool = make_pool(workers, torch_threads=torch_threads, pin_cpus=pin_cpus, preload_model=weights_path)
+    try:
+        if pool is None:
+            get_model(weights_path)
+        else:
+            _warm_pool(pool, workers)
+        jobs = ((name, (src, name, temp_dir, "", MemoryImageWriter(), options)) for src, name in sample)
+        t0 = time.perf_counter()
+        for name, _, error in run_jobs(jobs, pool=pool, workers=workers):
+            if error is not None:
+                raise error
+        return time.perf_counter() - t0
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        _restore_runtime(state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker/thread/batch settings on this machine")
+    parser.add_argument("sample_folder", help="Folder with a few representative PDFs")
+    parser.add_argument("--sample-size", type=int, default=4, help="Number of PDFs to benchmark on.")
+    parser.add_argument("--workers", type=_int_list, default=None, help="Comma-separated worker counts to try.")
+    parser.add_argument("--threads", type=_int_list, default=None,
+                        help="Comma-separated torch intra-op thread counts to try.")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 2, 4])
+    parser.add_argument("--render-scale", type=float, default=DEFAULT_SETTINGS["render_scale"])
+    parser.add_argument("--pin-cpus", action="store_true", help="Also try pinning each worker to its own cores.")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="Where to write the best configuration.")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    args = parser.parse_args()
+
+    ensure_yolo_weights(weights_path=args.weights)
+
+    sample = list(itertools.islice(iter_corpus(args.sample_folder), args.sample_size))
+    if not sample:
+        raise SystemExit(f"No PDFs found in {args.sample_folder}")
+    pages = 0
+    for src, _ in sample:
+        with fitz.open(src) as doc:
+            pages += len(doc)
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    if args.workers or args.threads:
+        grid = [(w, t) for w in (args.workers or [1]) for t in (args.threads or [max(1, cores // w)])]
+    else:
+        grid = list(default_grid(cores))
+    pins = [False, True] if args.pin_cpus else [False]
+
+    print(f"[INFO] {len(sample)} PDFs / {pages} pages, {cores} cores")
+    results = []
+    for (w, t), b, pin in itertools.product(grid, args.batch_sizes, pins):
+        if w * t > cores:
+            continue
+        try:
+            elapsed = benchmark(sample, w, t, b, args.render_scale, pin, weights_path=args.weights)
+        except Exception as e:
+            print(f"[WARN] workers={w} threads={t} batch={b} pin={pin}: {e}")
+            continue
+        pps = pages / elapsed
+        results.append({"workers": w, "torch_threads": t, "batch_size": b, "pin_cpus": pin,
+                        "seconds": round(elapsed, 3), "pages_per_sec": round(pps, 3)})
+        print(f"[tune] workers={w:<2} threads={t:<2} batch={b} pin={pin!s:<5} → {pps:.2f} pages/s")
+
+    if not results:
+        raise SystemExit("No configuration completed.")
+    best = max(results, key=lambda r: r["pages_per_sec"])
+    settings = {k: best[k] for k in ("workers", "torch_threads", "batch_size", "pin_cpus")}
+    settings["render_scale"] = args.render_scale
+    path = save_profile(settings, args.profile, pages_per_sec=best["pages_per_sec"], weights=args.weights,
+                        results=results)
+    print(f"✅ Best: {settings} ({best['pages_per_sec']:.2f} pages/s) → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import hashlib, heapq, os, re
+from pathlib import Path
+
+
+def iter_pdfs(input_folder, recursive=True):
+    # Streams PDFs with os.scandir instead of materialising the listing; entries are
+    # visited in name order per directory so runs over the same tree are reproducible.
+    stack = [Path(input_folder)]
+    while stack:
+        folder = stack.pop()
+        with os.scandir(folder) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not entry.name.startswith("."):
+                    subdirs.append(Path(entry.path))
+            elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                yield Path(entry.path)
+        stack.extend(reversed(subdirs))
+
+
+def relative_key(pdf_path, input_folder):
+    return Path(pdf_path).relative_to(input_folder).as_posix()
+
+
+def doc_id(pdf_path, input_folder):
+    # Top-level files keep their stem; nested ones get their folders joined by "__"
+    # so that papers with the same file name in different folders don't collide.
+    rel = relative_key(pdf_path, input_folder)
+    return rel[:-4].replace("/", "__")
+
+
+def parse_shard(spec):
+    if spec is None:
+        return None
+    try:
+        i, n = (int(x) for x in str(spec).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {spec!r}, expected i/N (e.g. 0/4)")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"Invalid shard spec {spec!r}: need 0 <= i < N")
+    return i, n
+
+
+def stable_bucket(key, n):
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % n
+
+
+def iter_corpus(input_folder, recursive=True, shard=None):
+    # Yields (pdf_path, doc_id) for the slice of the corpus owned by `shard` ((i, N) or None).
+    for pdf_path in iter_pdfs(input_folder, recursive=recursive):
+        key = relative_key(pdf_path, input_folder)
+        if shard is not None and stable_bucket(key, shard[1]) != shard[0]:
+            continue
+        yield pdf_path, doc_id(pdf_path, input_folder)
+
+
+# Render and inference cost grows with page area; costs are counted in US Letter page equivalents.
+LETTER_AREA = 612.0 * 792.0
+
+
+def pdf_cost(pdf_path):
+    # (pages, cost) from the page tree only; no page is loaded or rendered.
+    import fitz
+
+    try:
+        with fitz.open(pdf_path) as doc:
+            n = len(doc)
+            area = 0.0
+            for i in range(n):
+                r = doc.page_cropbox(i)
+                area += r.width * r.height
+    except Exception:
+        return 0, 0.0
+    return n, area / LETTER_AREA
+
+
+def lpt_order(items):
+    # Longest-processing-time-first: the biggest documents start first so they don't end up alone at the tail.
+    # items: (pdf_path, doc_id) -> [(pdf_path, doc_id, pages, cost)], ties broken by doc_id for stable runs.
+    planned = [(pdf_path, doc_id, *pdf_cost(pdf_path)) for pdf_path, doc_id in items]
+    planned.sort(key=lambda t: (-t[3], t[1]))
+    return planned
+
+
+def lpt_makespan(costs, workers):
+    # Finish time of the busiest worker when jobs (in the given order) go to whichever worker frees up first.
+    loads = [0.0] * max(1, workers)
+    for c in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + c)
+    return max(loads)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+RX_WORD = re.compile(r"[a-z0-9]+")
+MIN_FINGERPRINT_CHARS = 200
+
+
+def first_page_fingerprint(path):
+    # Hash of the first page's words (lower-cased, punctuation and layout dropped); None for
+    # pages with too little text to tell papers apart (scans, cover images) or unreadable files.
+    import fitz
+
+    try:
+        with fitz.open(path) as doc:
+            text = doc[0].get_text("text") if len(doc) else ""
+    except Exception:
+        return None
+    norm = " ".join(RX_WORD.findall(text.lower()))
+    if len(norm) < MIN_FINGERPRINT_CHARS:
+        return None
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class DuplicateFilter:
+    """
+    Drops duplicate PDFs from a stream of (pdf_path, doc_id) items.
+
+    The first file seen with a given content hash (and, with `by_text`, a
+    given first-page text fingerprint) is the canonical copy and passes
+    through; later ones are recorded in `duplicates` as
+    {doc_id: {"src", "canonical", "reason"}} so their outputs can be linked
+    to the canonical copy's after the run. Sizes are compared first, so only
+    files that share a size with an earlier file are hashed.
+    """
+
+    def __init__(self, by_text=False):
+        self.by_text = by_text
+        self.sizes = {}
+        self.hashes = {}
+        self.texts = {}
+        self.duplicates = {}
+
+    def _hash_of(self, path, size):
+        # The first file of each size is only hashed once a second file of that size shows up.
+        first = self.sizes.get(size)
+        if first is None:
+            return None
+        if isinstance(first, tuple):
+            src, first_id = first
+            self.hashes.setdefault(file_digest(src), first_id)
+            self.sizes[size] = True
+        return file_digest(path)
+
+    def filter(self, items):
+        for pdf_path, doc_id in items:
+            try:
+                size = os.path.getsize(pdf_path)
+            except OSError:
+                yield pdf_path, doc_id
+                continue
+            digest = self._hash_of(pdf_path, size)
+            if digest is not None and digest in self.hashes:
+                self.duplicates[doc_id] = {"src": str(pdf_path), "canonical": self.hashes[digest], "reason": "hash"}
+                continue
+            fingerprint = first_page_fingerprint(pdf_path) if self.by_text else None
+            if fingerprint is not None and fingerprint in self.texts:
+                self.duplicates[doc_id] = {"src": str(pdf_path), "canonical": self.texts[fingerprint],
+                                           "reason": "first_page_text"}
+                continue
+
+            if size not in self.sizes:
+                self.sizes[size] = (pdf_path, doc_id)
+            if digest is not None:
+                self.hashes[digest] = doc_id
+            if fingerprint is not None:
+                self.texts[fingerprint] = doc_id
+            yield pdf_path, doc_id
@@ -0,0 +1,213 @@
+import atexit, multiprocessing, os, threading, time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait as wait_connections
+
+
+class DocumentTimeout(Exception):
+    pass
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def rss_bytes(pid=None):
+    # Resident set size of a process (default: this one); psutil when installed, /proc otherwise.
+    pid = pid or os.getpid()
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _child_main(conn, initializer, initargs):
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        fn, args = msg
+        try:
+            out = ("ok", fn(*args))
+        except BaseException as e:
+            out = ("err", e)
+        try:
+            conn.send(out)
+        except Exception as e:
+            conn.send(("err", RuntimeError(f"{type(e).__name__} while sending result: {e}")))
+
+
+class _Slot:
+    def __init__(self):
+        self.proc = None
+        self.conn = None
+        self.fut = None
+        self.started = None
+
+
+class SupervisedPool:
+    """
+    Process pool where every task runs under a wall-clock and RSS budget.
+
+    Workers are long-lived (the model is loaded once per worker, not per
+    document). A monitor thread polls the busy workers; one that overruns
+    `timeout` seconds or `max_rss_mb` is killed and replaced, and its task's
+    future fails with DocumentTimeout / MemoryBudgetExceeded. A worker that
+    dies on its own fails its task with WorkerCrashed. `submit` returns
+    concurrent.futures.Future objects, so callers can use futures.wait as with
+    ProcessPoolExecutor.
+    """
+
+    def __init__(self, workers, initializer=None, initargs=(), timeout=None, max_rss_mb=None, poll=0.2):
+        self.ctx = multiprocessing.get_context()
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.poll = poll
+        self.tasks = deque()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.slots = [_Slot() for _ in range(max(1, workers))]
+        for slot in self.slots:
+            self._spawn(slot)
+        self.monitor = threading.Thread(target=self._run, daemon=True)
+        self.monitor.start()
+        atexit.register(self._atexit)
+
+    def _atexit(self):
+        if not self.closed:
+            self.shutdown(wait=False, cancel_futures=True)
+
+    def _spawn(self, slot):
+        parent_conn, child_conn = self.ctx.Pipe()
+        # Not daemonic, so a worker may start processes of its own (render workers); shutdown() and the
+        # atexit hook stop them, and a worker whose pipe closes exits by itself.
+        slot.proc = self.ctx.Process(target=_child_main, args=(child_conn, self.initializer, self.initargs))
+        slot.proc.start()
+        child_conn.close()
+        slot.conn = parent_conn
+        slot.fut = None
+        slot.started = None
+
+    def _kill(self, slot, error):
+        fut = slot.fut
+        slot.proc.kill()
+        slot.proc.join(5)
+        slot.conn.close()
+        if not self.closed:
+            self._spawn(slot)
+        if fut is not None and not fut.done():
+            fut.set_exception(error)
+
+    def submit(self, fn, *args):
+        fut = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot submit to a closed pool")
+            self.tasks.append((fut, fn, args))
+        return fut
+
+    def _dispatch(self):
+        for slot in self.slots:
+            if slot.fut is not None:
+                continue
+            if not slot.proc.is_alive():
+                slot.conn.close()
+                self._spawn(slot)
+            while True:
+                with self.lock:
+                    if not self.tasks:
+                        return
+                    fut, fn, args = self.tasks.popleft()
+                if fut.set_running_or_notify_cancel():
+                    break
+            try:
+                slot.conn.send((fn, args))
+            except Exception as e:
+                fut.set_exception(e)
+                continue
+            slot.fut = fut
+            slot.started = time.monotonic()
+
+    def _collect(self):
+        busy = {slot.conn: slot for slot in self.slots if slot.fut is not None}
+        sentinels = {slot.proc.sentinel: slot for slot in busy.values()}
+        if not busy:
+            time.sleep(self.poll)
+            return
+        for ready in wait_connections(list(busy) + list(sentinels), timeout=self.poll):
+            slot = busy.get(ready) or sentinels.get(ready)
+            if slot.fut is None:
+                continue
+            try:
+                status, value = slot.conn.recv()
+            except (EOFError, OSError):
+                slot.proc.join(1)
+                self._kill(slot, WorkerCrashed(f"worker exited with code {slot.proc.exitcode}"))
+                continue
+            fut, slot.fut, slot.started = slot.fut, None, None
+            if status == "ok":
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+
+    def _enforce_budgets(self):
+        now = time.monotonic()
+        for slot in self.slots:
+            if slot.fut is None:
+                continue
+            if self.timeout and now - slot.started > self.timeout:
+                self._kill(slot, DocumentTimeout(f"timeout after {self.timeout:g}s"))
+                continue
+            if self.max_rss:
+                rss = rss_bytes(slot.proc.pid)
+                if rss > self.max_rss:
+                    self._kill(slot, MemoryBudgetExceeded(
+                        f"memory budget exceeded ({rss / 2**20:.0f} MB > {self.max_rss / 2**20:.0f} MB)"))
+
+    def _run(self):
+        while not self.closed:
+            self._dispatch()
+            self._collect()
+            self._enforce_budgets()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        atexit.unregister(self._atexit)
+        with self.lock:
+            self.closed = True
+            if cancel_futures:
+                while self.tasks:
+                    self.tasks.popleft()[0].cancel()
+        self.monitor.join()
+        for slot in self.slots:
+            if slot.fut is not None and not slot.fut.done():
+                slot.fut.cancel() or slot.fut.set_exception(RuntimeError("pool shut down"))
+            try:
+                slot.conn.send(None)
+            except Exception:
+                pass
+        for slot in self.slots:
+            slot.proc.join(5 if wait else 0)
+            if slot.proc.is_alive():
+                slot.proc.kill()
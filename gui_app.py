@@ -1,17 +1,30 @@
 import os
+import multiprocessing
 import threading
 import queue
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
 from weights_utils import ensure_yolo_weights
+from corpus_utils import iter_pdfs
 from pdf_extractor import export_pdfs_to_mds
+from progress import QueueSink, ThroughputTracker, drain
+from tuning import load_profile, resolve_settings
 
 APP_TITLE = "PDF → Markdown (DocLayNet YOLO) GUI"
 DEFAULT_WEIGHTS = "yolo_model/doclaynet.pt"
 HF_REPO_ID = "malaysia-ai/YOLOv8X-DocLayNet-Full-1024-42"
 HF_REPO_FILE = "weights/best.pt"
 
+
+def _run_folder_process(options, event_queue, cancel):
+    # One folder per process: a run's memory governor and model cache budget are process-wide state,
+    # so folders running side by side must not share a process. Returns None when stopped before starting.
+    if cancel.is_set():
+        return None
+    return export_pdfs_to_mds(on_event=QueueSink(event_queue), cancel=cancel, **options)
+
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -24,7 +37,11 @@ class App(tk.Tk):
         self.save_removed  = tk.BooleanVar(value=False)
         self.prefer_cli    = tk.BooleanVar(value=True)
         self.weights_path  = tk.StringVar(value=DEFAULT_WEIGHTS)
+        self.parallel_folders = tk.IntVar(value=2)
+        self.status_var    = tk.StringVar(value="idle")
+        self.tracker = None
         self.log_queue = queue.Queue()
+        self.tuning = resolve_settings(profile=load_profile(quiet=True))
         self._build_ui()
         self.after(100, self._drain_log_queue)
         self.stop_flag = threading.Event()
@@ -61,12 +78,15 @@ class App(tk.Tk):
         tk.Checkbutton(cb_row, text="Save raw JSONL", variable=self.save_raw_json).pack(side="left")
         tk.Checkbutton(cb_row, text="Save removed sections", variable=self.save_removed).pack(side="left")
         tk.Checkbutton(cb_row, text="Prefer huggingface-cli", variable=self.prefer_cli).pack(side="left", padx=12)
+        tk.Label(cb_row, text="Folders in parallel:").pack(side="left", padx=(12, 2))
+        tk.Spinbox(cb_row, from_=1, to=16, width=4, textvariable=self.parallel_folders).pack(side="left")
 
         run_bar = tk.Frame(self); run_bar.pack(fill="x", padx=12, pady=8)
         self.run_btn = tk.Button(run_bar, text="Run Pipeline", height=2, command=self._on_run)
         self.run_btn.pack(side="left")
         self.stop_btn = tk.Button(run_bar, text="Stop", command=self._on_stop, state="disabled")
         self.stop_btn.pack(side="left", padx=6)
+        tk.Label(run_bar, textvariable=self.status_var, anchor="w").pack(side="left", padx=12, fill="x", expand=True)
 
         tk.Label(self, text="Log:").pack(anchor="w", padx=12)
         self.log = ScrolledText(self, height=12, state="normal")
@@ -77,6 +97,7 @@ class App(tk.Tk):
             self._log("Drag-and-drop available (tkinterdnd2 installed).")
         except Exception:
             self._log("Drag-and-drop not enabled (install tkinterdnd2 to enable).")
+        self._log(f"[tune] runtime settings: {self.tuning}")
 
     def _add_folder(self):
         d = filedialog.askdirectory(title="Choose input folder (contains PDFs)")
@@ -153,41 +174,87 @@ class App(tk.Tk):
         self.stop_btn.config(state="normal")
         self._log("=== Pipeline started ===")
         self.stop_flag.clear()
-        t = threading.Thread(target=self._worker, daemon=True)
+        self.tracker = ThroughputTracker(total_docs=0)
+        folders = [self._folder_options(i, d) for i, d in enumerate(self.input_dirs, start=1)]
+        t = threading.Thread(target=self._worker, args=(folders, self.parallel_folders.get()), daemon=True)
         t.start()
 
     def _on_stop(self):
         self.stop_flag.set()
-        self._log("[stop] Requested. Finishing current file…")
+        self._log("[stop] Requested. Stopping after the current page…")
+
+    def _on_event(self, event):
+        self.tracker(event)
+        kind = event.get("event")
+        if kind == "doc_done":
+            self._log(f"[doc] {event['doc']} ({event['seconds']:.1f}s)")
+        elif kind == "doc_failed":
+            self._log(f"[doc] {event['doc']} FAILED: {event['error']}")
+
+    def _folder_options(self, i, in_dir):
+        # Read on the Tk thread: the worker thread must not touch Tk variables.
+        dataset_name = os.path.basename(in_dir.rstrip(os.sep)) or f"job_{i}"
+        out_name = os.path.join(self.output_dir, dataset_name)
+        options = dict(input_folder=in_dir, output_folder=out_name, save_raw_json=self.save_raw_json.get(),
+                       save_removed=self.save_removed.get(), weights_path=self.weights_path.get(), **self.tuning)
+        return dataset_name, options
+
+    def _report_folder(self, dataset_name, fut):
+        try:
+            failed = fut.result()
+        except Exception as e:
+            self._log(f"[error] {dataset_name}: {e}")
+            return
+        if failed is None:
+            self._log(f"[stop] {dataset_name}: not started")
+        elif failed:
+            self._log(f"[warn] {dataset_name}: failed files:\n  - " + "\n  - ".join(map(str, failed)))
+        elif self.stop_flag.is_set():
+            self._log(f"[stop] {dataset_name}: cancelled")
+        else:
+            self._log(f"[ok] {dataset_name}: completed without failures")
 
-    def _worker(self):
+    def _worker(self, folders, parallel):
+        # folders: [(dataset_name, export_pdfs_to_mds options)]; each one runs in its own process and
+        # reports events and honours Stop through a manager queue and event.
+        manager = None
         try:
-            for i, in_dir in enumerate(self.input_dirs, start=1):
-                if self.stop_flag.is_set():
-                    self._log("[stop] Aborting remaining jobs.")
-                    break
-                dataset_name = os.path.basename(in_dir.rstrip(os.sep)) or f"job_{i}"
-                out_name = os.path.join(self.output_dir, dataset_name)
-
-                self._log(f"[run] {i}/{len(self.input_dirs)} → input='{in_dir}'  out='{out_name}'")
-                failed = export_pdfs_to_mds(
-                    input_folder=in_dir,
-                    output_folder=out_name,
-                    save_raw_json=self.save_raw_json.get(),
-                    save_removed=self.save_removed.get(),
-                )
-                if failed:
-                    self._log(f"[warn] failed files:\n  - " + "\n  - ".join(map(str, failed)))
-                else:
-                    self._log("[ok] completed without failures")
+            for _, options in folders:
+                self.tracker.add_total(sum(1 for _ in iter_pdfs(options["input_folder"])))
 
+            manager = multiprocessing.Manager()
+            events, cancel = manager.Queue(), manager.Event()
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=max(1, parallel), mp_context=ctx) as pool:
+                futures = {}
+                for i, (dataset_name, options) in enumerate(folders, start=1):
+                    self._log(f"[run] {i}/{len(folders)} → input='{options['input_folder']}'  "
+                              f"out='{options['output_folder']}'")
+                    futures[pool.submit(_run_folder_process, options, events, cancel)] = dataset_name
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    if self.stop_flag.is_set():
+                        cancel.set()
+                    drain(events, self._on_event)
+                    for fut in done:
+                        self._report_folder(futures[fut], fut)
+                drain(events, self._on_event)
+
+            if self.stop_flag.is_set():
+                self._log("[stop] Aborted remaining jobs.")
             self._log("=== Pipeline finished ===")
         except Exception as e:
             self._log(f"[error] {e}")
-            messagebox.showerror("Run error", str(e))
+            self.after(0, lambda err=str(e): messagebox.showerror("Run error", err))
         finally:
-            self.run_btn.config(state="normal")
-            self.stop_btn.config(state="disabled")
+            if manager is not None:
+                manager.shutdown()
+            self.after(0, self._run_finished)
+
+    def _run_finished(self):
+        self.run_btn.config(state="normal")
+        self.stop_btn.config(state="disabled")
 
     def _drain_log_queue(self):
         try:
@@ -197,6 +264,8 @@ class App(tk.Tk):
                 self.log.see(tk.END)
         except queue.Empty:
             pass
+        if self.tracker is not None:
+            self.status_var.set(self.tracker.summary())
         self.after(100, self._drain_log_queue)
 
     def _log(self, msg: str):
@@ -1,7 +1,9 @@
 # main.py
 import argparse
+from corpus_utils import parse_shard
+from tuning import DEFAULT_PROFILE, load_profile, recorded_pages_per_sec, resolve_settings
 from weights_utils import ensure_yolo_weights
-from pdf_extractor import export_pdfs_to_mds
+from pdf_extractor import dry_run, export_pdfs_to_mds
 
 def main():
     parser = argparse.ArgumentParser(description="PDF → Markdown pipeline")
@@ -9,6 +11,103 @@ def main():
     parser.add_argument("output_folder", help="Output/dataset folder name")
     parser.add_argument("--save-raw-json", action="store_true", default=False)
     parser.add_argument("--save-removed", action="store_true", default=False)
+    parser.add_argument("--save-detections", action="store_true", default=False,
+                        help="Also save the unfiltered YOLO records (page, class, box, conf, content) under "
+                             "detections/ so refilter.py can regenerate outputs without inference.")
+    parser.add_argument("--dedup-images", action="store_true", default=False,
+                        help="Store crops once per distinct pixel content under outputs/images/_objects/.")
+    parser.add_argument("--output-backend", choices=["files", "shards"], default="files",
+                        help="files: one file per artifact (default); shards: tar shards + index under shards/.")
+    parser.add_argument("--shard-size-mb", type=float, default=512,
+                        help="Roll over to a new shard after this many MB (shards backend).")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="Only process the i-th of N disjoint slices of the corpus (0-based, stable by path hash).")
+    parser.add_argument("--no-recursive", action="store_true",
+                        help="Only look for PDFs directly inside input_folder.")
+    parser.add_argument("--queue", default=None, metavar="DB",
+                        help="Work-queue mode: enqueue input_folder into this SQLite file and process leased jobs. "
+                             "Run the same command on any number of hosts/processes sharing the file.")
+    parser.add_argument("--lease-timeout", type=float, default=3600,
+                        help="Seconds before the lease of a dead worker is handed to another worker (queue mode).")
+    parser.add_argument("--max-retries", type=int, default=3,
+                        help="Attempts per job before it is marked failed (queue mode).")
+    parser.add_argument("--scratch-dir", default=None,
+                        help="Parent folder for the private per-run temp directory (default: system temp).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Documents processed in parallel (default: tuning profile, else 1).")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="torch intra-op threads per worker (default: tuning profile, else torch's default).")
+    parser.add_argument("--batch-size", type=int, default=None, help="Pages per YOLO forward pass.")
+    parser.add_argument("--render-scale", type=float, default=None, help="Page render zoom for YOLO (default 3.0).")
+    parser.add_argument("--pin-cpus", action="store_true", default=None,
+                        help="Pin each worker to its own set of cores.")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE,
+                        help="Tuning profile written by autotune.py (loaded automatically if present).")
+    parser.add_argument("--no-profile", action="store_true", help="Ignore the tuning profile.")
+    parser.add_argument("--name-filter", action="store_true",
+                        help="Drop author-list records detected with a BERT NER model (needs transformers).")
+    parser.add_argument("--ner-model", default=None,
+                        help="NER model id or local path for --name-filter (default: dslim/bert-base-NER).")
+    parser.add_argument("--ner-backend", choices=["torch", "onnx"], default="torch",
+                        help="Inference backend for --name-filter (onnx needs optimum[onnxruntime]).")
+    parser.add_argument("--ner-quantize", action="store_true", help="Use a dynamically int8-quantized NER model.")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Optimized CPU inference: fused conv+bn, channels-last, inference_mode, warmup at load.")
+    parser.add_argument("--precision", choices=["fp32", "bf16"], default="fp32",
+                        help="With --optimize: bf16 autocast on CPUs with native bf16 support.")
+    parser.add_argument("--compile", action="store_true", help="With --optimize: also torch.compile the model.")
+    parser.add_argument("--doc-timeout", type=float, default=None,
+                        help="Kill and skip a document after this many seconds (runs documents in watched workers).")
+    parser.add_argument("--doc-memory-mb", type=float, default=None,
+                        help="Kill and skip a document whose worker exceeds this RSS.")
+    parser.add_argument("--heavy-page-mb", type=float, default=8.0,
+                        help="Render pages with content streams above this size at reduced DPI (0 disables).")
+    parser.add_argument("--dedup-pdfs", choices=["hash", "text"], default=None,
+                        help="Process duplicate PDFs once: 'hash' matches byte-identical files, 'text' also matches "
+                             "the same first-page text. Duplicates get the canonical copy's outputs.")
+    parser.add_argument("--render-workers", type=int, default=0,
+                        help="Render pages in this many separate processes per document worker, handing frames "
+                             "over through shared memory (0: render in the inference process).")
+    parser.add_argument("--model-cache-mb", type=float, default=None,
+                        help="Memory for loaded detectors per process; least recently used models are unloaded "
+                             "beyond it (default: keep at most two).")
+    parser.add_argument("--page-workers", type=int, default=0,
+                        help="Split long documents into page ranges detected by this many processes (own PDF handle "
+                             "and model each), merged back in page order.")
+    parser.add_argument("--split-pages", type=int, default=200,
+                        help="With --page-workers, only documents with more planned pages than this are split.")
+    parser.add_argument("--index", default=None, metavar="DB",
+                        help="Also write every region (paper, page, class, box, conf, text, image) into this SQLite "
+                             "database with a full-text index; query it with region_index.py.")
+    parser.add_argument("--tile-above", type=float, default=None, metavar="PTS",
+                        help="Detect pages whose longest side exceeds this many points (e.g. 1400: A2 and larger) "
+                             "in overlapping letter-sized tiles instead of one huge render.")
+    parser.add_argument("--strip-banners", action="store_true",
+                        help="Learn text repeated at the same place on the first pages (license banners, running "
+                             "headers, watermarks) and drop matching regions before text extraction and filtering.")
+    parser.add_argument("--embedded-images", action="store_true",
+                        help="Write picture regions from the bitmaps embedded in the PDF (stored bytes, once per "
+                             "image) when one matches the detected box; other regions are still cropped.")
+    parser.add_argument("--max-memory", type=float, default=None, metavar="MB",
+                        help="Soft memory budget per worker process: batch size, render scale and documents in "
+                             "flight are lowered automatically to stay under it.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Print per-stage RSS and Python (tracemalloc) peaks for every document.")
+    parser.add_argument("--schedule", choices=["discovery", "lpt"], default="discovery",
+                        help="discovery: process PDFs as they are found; lpt: read page counts/sizes first and start "
+                             "the largest documents first, so no worker finishes alone at the end.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only print the number of PDFs and pages and the estimated wall-clock, then exit.")
+    parser.add_argument("--pages-per-sec", type=float, default=None,
+                        help="Throughput for --dry-run (default: the one autotune.py recorded in the profile).")
+    parser.add_argument("--max-pages", type=int, default=None,
+                        help="Run layout detection on at most this many pages per PDF.")
+    parser.add_argument("--page-range", default=None, metavar="RANGES",
+                        help="Only these 1-based pages per PDF, e.g. '1-10,15,20-'.")
+    parser.add_argument("--skip-references", action="store_true",
+                        help="Skip reference-dense pages after a References/Bibliography heading (text-layer check).")
+    parser.add_argument("--stop-at-references", action="store_true",
+                        help="Skip every page after the References/Bibliography heading, appendices included.")
     parser.add_argument("--weights", default="yolo_model/doclaynet.pt",
                         help="Path to YOLO weights (will auto-download if missing).")
     parser.add_argument("--no-auto-download", action="store_true",
@@ -19,6 +118,18 @@ def main():
     parser.add_argument("--repo-file", default="weights/best.pt")
     args = parser.parse_args()
 
+    settings = resolve_settings(
+        overrides={"workers": args.workers, "torch_threads": args.torch_threads, "batch_size": args.batch_size,
+                   "render_scale": args.render_scale, "pin_cpus": args.pin_cpus},
+        profile=None if args.no_profile else load_profile(args.profile),
+    )
+
+    if args.dry_run:
+        pps = args.pages_per_sec or (None if args.no_profile else recorded_pages_per_sec(args.profile))
+        dry_run(args.input_folder, recursive=not args.no_recursive, shard=args.shard,
+                workers=settings["workers"], pages_per_sec=pps)
+        return
+
     # Ensure weights exist (unless user opted out)
     if not args.no_auto_download:
         ensure_yolo_weights(
@@ -33,6 +144,44 @@ def main():
         args.output_folder,
         save_raw_json=args.save_raw_json,
         save_removed=args.save_removed,
+        dedup_images=args.dedup_images,
+        output_backend=args.output_backend,
+        shard_size_mb=args.shard_size_mb,
+        recursive=not args.no_recursive,
+        shard=args.shard,
+        queue_path=args.queue,
+        lease_timeout=args.lease_timeout,
+        max_retries=args.max_retries,
+        scratch_dir=args.scratch_dir,
+        name_filter=args.name_filter,
+        ner_model=args.ner_model,
+        ner_backend=args.ner_backend,
+        ner_quantize=args.ner_quantize,
+        optimize=args.optimize,
+        precision=args.precision,
+        compile_model=args.compile,
+        doc_timeout=args.doc_timeout,
+        doc_memory_mb=args.doc_memory_mb,
+        heavy_page_bytes=int(args.heavy_page_mb * 1024 * 1024),
+        max_pages=args.max_pages,
+        max_memory_mb=args.max_memory,
+        dedup_pdfs=args.dedup_pdfs,
+        save_detections=args.save_detections,
+        render_workers=args.render_workers,
+        embedded_images=args.embedded_images,
+        strip_banners=args.strip_banners,
+        index_path=args.index,
+        tile_above=args.tile_above,
+        page_workers=args.page_workers,
+        weights_path=args.weights,
+        model_cache_mb=args.model_cache_mb,
+        split_pages=args.split_pages,
+        schedule=args.schedule,
+        trace_memory=args.trace_memory,
+        page_range=args.page_range,
+        skip_references=args.skip_references,
+        stop_at_references=args.stop_at_references,
+        **settings,
     )
 
     if failed:
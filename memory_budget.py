@@ -0,0 +1,121 @@
+import gc, tracemalloc
+
+from doc_watchdog import rss_bytes
+from progress import emit
+
+# Fractions of the budget: above HIGH the governor steps down, below LOW it may step back up.
+HIGH_WATERMARK = 0.85
+LOW_WATERMARK = 0.60
+MIN_RENDER_SCALE = 1.5
+RENDER_SCALE_STEP = 0.5
+# Rendering a page holds the pixmap samples, the PIL image and crops of it at the same time.
+PIXMAP_COPIES = 3
+
+
+def page_pixels_bytes(rect, render_scale):
+    return int(rect.width * render_scale) * int(rect.height * render_scale) * 3
+
+
+class MemoryGovernor:
+    """
+    Per-process memory accounting and soft budget.
+
+    `sample(stage)` records RSS (and, with `trace`, the tracemalloc peak of
+    Python allocations since the previous sample) under a stage name. With
+    `max_memory_mb`, `fit()` picks the batch size and render scale for the
+    next batch of pages: it steps down when RSS crosses the high watermark or
+    the batch's pixmaps would not fit in the remaining headroom, and lets the
+    batch size grow back once RSS is below the low watermark. Reductions are
+    logged and reported as "memory_adjust" events. `queue_depth()` does the
+    same for the number of documents the parent keeps in flight.
+    """
+
+    def __init__(self, max_memory_mb=None, trace=False, on_event=None, min_render_scale=MIN_RENDER_SCALE):
+        self.max_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+        self.trace = trace
+        self.on_event = on_event
+        self.min_render_scale = min_render_scale
+        self.stages = {}
+        self.doc = None
+        self.batch_cap = None
+        self.scale_cap = None
+        self.depth_cap = None
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start_document(self, doc):
+        self.doc = doc
+        self.stages = {}
+        # Render scale is only reduced within a document; a new document starts at full quality again.
+        self.scale_cap = None
+        if self.trace:
+            tracemalloc.reset_peak()
+
+    def sample(self, stage):
+        rss = rss_bytes()
+        peak = self.stages.setdefault(stage, {"rss_mb": 0.0, "py_peak_mb": 0.0})
+        peak["rss_mb"] = max(peak["rss_mb"], rss / 2**20)
+        if self.trace:
+            peak["py_peak_mb"] = max(peak["py_peak_mb"], tracemalloc.get_traced_memory()[1] / 2**20)
+            tracemalloc.reset_peak()
+        return rss
+
+    def report(self):
+        stages = {k: {m: round(v, 1) for m, v in s.items()} for k, s in self.stages.items()}
+        emit(self.on_event, "memory", doc=self.doc, stages=stages)
+        if self.trace:
+            txt = ", ".join(f"{k} {s['rss_mb']:.0f}MB rss/{s['py_peak_mb']:.0f}MB py" for k, s in stages.items())
+            print(f"[INFO] memory {self.doc}: {txt}")
+        return stages
+
+    def _adjusted(self, what, old, new, rss):
+        where = f" ({self.doc})" if self.doc else ""
+        print(f"[WARN] memory {rss / 2**20:.0f}MB of {self.max_bytes / 2**20:.0f}MB budget{where}:"
+              f" {what} {old:g} → {new:g}")
+        emit(self.on_event, "memory_adjust", doc=self.doc, setting=what, old=old, new=new, rss_mb=rss / 2**20)
+
+    def fit(self, batch_size, render_scale, rect):
+        # Batch size and render scale for the next batch of pages of size `rect` (page points).
+        if not self.max_bytes:
+            return batch_size, render_scale
+        rss = self.sample("batch")
+        if rss > HIGH_WATERMARK * self.max_bytes:
+            gc.collect()
+            rss = self.sample("batch")
+        b = min(batch_size, self.batch_cap or batch_size)
+        s = min(render_scale, self.scale_cap or render_scale)
+        if rss < LOW_WATERMARK * self.max_bytes and b < batch_size:
+            b = min(batch_size, b * 2)
+
+        over = rss > HIGH_WATERMARK * self.max_bytes
+        headroom = HIGH_WATERMARK * self.max_bytes - rss
+        need = lambda b_, s_: b_ * page_pixels_bytes(rect, s_) * PIXMAP_COPIES
+        new_b, new_s = b, s
+        while new_b > 1 and (over or need(new_b, new_s) > headroom):
+            new_b = max(1, new_b // 2)
+            over = False
+        while new_s > self.min_render_scale and (over or need(new_b, new_s) > headroom):
+            new_s = max(self.min_render_scale, new_s - RENDER_SCALE_STEP)
+            over = False
+
+        if new_b != b:
+            self._adjusted("batch_size", b, new_b, rss)
+        if new_s != s:
+            self._adjusted("render_scale", s, new_s, rss)
+        self.batch_cap, self.scale_cap = new_b, new_s
+        return new_b, new_s
+
+    def queue_depth(self, depth):
+        # Documents the parent keeps in flight (their results wait in this process).
+        if not self.max_bytes:
+            return depth
+        rss = rss_bytes()
+        cap = self.depth_cap or depth
+        if rss > HIGH_WATERMARK * self.max_bytes and cap > 1:
+            new = max(1, cap // 2)
+            self._adjusted("queue_depth", cap, new, rss)
+            cap = new
+        elif rss < LOW_WATERMARK * self.max_bytes and cap < depth:
+            cap = min(depth, cap * 2)
+        self.depth_cap = cap
+        return cap
@@ -1,13 +1,25 @@
-import json, os, shutil
+import io, json, multiprocessing, shutil, tempfile, time
+from concurrent.futures import FIRST_COMPLETED, wait
 from pathlib import Path
 from tqdm import tqdm
 
-from markdown_coverter import convert_jsonl_to_md
+from corpus_utils import DuplicateFilter, iter_corpus, lpt_makespan, lpt_order, parse_shard
+from doc_watchdog import SupervisedPool
+from memory_budget import MemoryGovernor
+from postprocess import banner_report, finish_document
+from region_index import RegionIndex
+from progress import Cancelled, QueueSink, check_cancel, drain, emit
+from tuning import apply_runtime, cpu_sets
+from yolo_model.YoloModel import (BATCH_SIZE, DEFAULT_WEIGHTS, HEAVY_PAGE_BYTES, RENDER_SCALE, configure_models,
+                                  get_model)
+from yolo_model.PageShards import SPLIT_PAGES
 from yolo_model.YoloPipline import yolo_pipeline
 from pdf_processor.PdfTrimmer import trim_sides
-from pdf_processor.NumberPaper import clean_line_number
-from text_filters.LicenseFilter import license_filter
-from text_filters.ReferenceFilter import reference_filter
+from pdf_processor.NumberPaper import clean_line_number, clean_line_number_bytes
+from pdf_processor.PagePlanner import parse_page_range
+from storage.ImageWriters import MemoryImageWriter
+from storage.OutputBackend import make_backend, DEFAULT_SHARD_SIZE_MB
+from work_queue import WorkQueue
 
 
 def read_jsonl(file_path):
@@ -16,76 +28,365 @@ def read_jsonl(file_path):
             yield json.loads(line)
 
 
-def export_pdfs_to_mds(input_folder, output_folder, save_raw_json=False, save_removed=False):
-    shutil.rmtree(output_folder, ignore_errors=True)
-    Path(output_folder).mkdir(parents=True, exist_ok=True)
+def _prepare_pdf(src_pdf, pdf_name, temp_dir):
+    tmp_pdf = temp_dir / f"{pdf_name}.pdf"
+    pre_pdf = temp_dir / f"{pdf_name}__pre.pdf"
+    try:
+        trim_sides(str(src_pdf), str(pre_pdf), top=0.05)
+        clean_line_number(str(pre_pdf), str(tmp_pdf))
+    except Exception as e:
+        raise RuntimeError(f"trim/clean failed: {type(e).__name__}: {e}") from e
+    finally:
+        pre_pdf.unlink(missing_ok=True)
+    return tmp_pdf
+
+
+def _prepare_pdf_bytes(data):
+    # _prepare_pdf without temp files: PDF bytes in, trimmed and line-number-cleaned PDF bytes out.
+    try:
+        trimmed = io.BytesIO()
+        trim_sides(io.BytesIO(data), trimmed, top=0.05)
+        cleaned, _ = clean_line_number_bytes(trimmed.getvalue())
+    except Exception as e:
+        raise RuntimeError(f"trim/clean failed: {type(e).__name__}: {e}") from e
+    return cleaned
+
+
+_governor = None
+_governor_options = None
+
+
+def _get_governor(memory_options, on_event):
+    # One governor per process, so the batch size it has backed off to carries over between documents.
+    # A run with other options (budget, tracing) gets a fresh one instead of the old budget and back-off.
+    global _governor, _governor_options
+    if not memory_options or not (memory_options.get("max_memory_mb") or memory_options.get("trace")):
+        return None
+    if _governor is None or memory_options != _governor_options:
+        _governor = MemoryGovernor(**memory_options)
+        _governor_options = dict(memory_options)
+    _governor.on_event = on_event
+    return _governor
+
 
-    temp_dir = Path("__cut_tmp__")
-    shutil.rmtree(temp_dir, ignore_errors=True)
-    temp_dir.mkdir(parents=True, exist_ok=True)
+def _convert_pdf(src_pdf, pdf_name, temp_dir, image_folder, writer, yolo_options, on_event=None, cancel=None,
+                 filter_options=None, memory_options=None, keep_detections=False):
+    # Runs in the calling process or in a pool worker.
+    check_cancel(cancel)
+    t0 = time.perf_counter()
+    emit(on_event, "doc_start", doc=pdf_name)
+    memory = _get_governor(memory_options, on_event)
+    if memory is not None:
+        memory.start_document(pdf_name)
+    yolo_pdf = _prepare_pdf(src_pdf, pdf_name, temp_dir)
+    if memory is not None:
+        memory.sample("prepare")
 
-    pdf_files = [f for f in os.listdir(input_folder) if f.lower().endswith(".pdf")][:10]
-    for pdf_file in tqdm(pdf_files, desc="Trimming PDFs", unit="file"):
-        src_pdf = Path(input_folder) / pdf_file
-        tmp_pdf = temp_dir / pdf_file
-        pre_pdf = temp_dir / f"{src_pdf.stem}__pre.pdf"
+    try:
+        jsonl_data, detections = yolo_pipeline(pdf_name, str(yolo_pdf), image_folder, image_writer=writer,
+                                               return_detections=True, on_event=on_event, cancel=cancel,
+                                               memory=memory, **yolo_options)
+    finally:
+        yolo_pdf.unlink(missing_ok=True)
+    md_data, jsonl_data, removed = finish_document(jsonl_data, filter_options, banners=banner_report(detections))
+    if memory is not None:
+        memory.sample("filters+markdown")
+        memory.report()
+    emit(on_event, "doc_done", doc=pdf_name, seconds=time.perf_counter() - t0, regions=len(jsonl_data))
+    return md_data, jsonl_data, removed, writer, detections if keep_detections else None
 
+
+def convert_pdf_bytes(pdf, name="document", on_event=None, cancel=None, name_filter=False, ner_options=None,
+                      **yolo_options):
+    """
+    Converts one PDF entirely in memory, for embedding the converter in
+    other services. `pdf` is the file's bytes or a binary file object;
+    trimming, line-number cleaning and rendering work on in-memory documents
+    (fitz.open(stream=...)) and no file is written. `yolo_options` are the
+    get_yolo_output options (weights_path, batch_size, render_scale, optimize,
+    max_pages, page_range, strip_banners, embedded_images, ...).
+
+    Returns a dict with "markdown", "regions" (the filtered records),
+    "removed" ({kind: records}), "detections" (raw records) and "images"
+    ({Markdown link: encoded bytes}, e.g. "images/<name>/p001_picture01.png").
+    """
+    data = pdf.read() if hasattr(pdf, "read") else bytes(pdf)
+    check_cancel(cancel)
+    t0 = time.perf_counter()
+    emit(on_event, "doc_start", doc=name)
+    if isinstance(yolo_options.get("page_range"), str):
+        yolo_options["page_range"] = parse_page_range(yolo_options["page_range"])
+    writer = MemoryImageWriter()
+    jsonl_data, detections = yolo_pipeline(name, _prepare_pdf_bytes(data), None, image_writer=writer,
+                                           return_detections=True, on_event=on_event, cancel=cancel, **yolo_options)
+    filter_options = {"name_filter": name_filter, "ner_options": ner_options or {}}
+    md_data, jsonl_data, removed = finish_document(jsonl_data, filter_options, banners=banner_report(detections))
+    emit(on_event, "doc_done", doc=name, seconds=time.perf_counter() - t0, regions=len(jsonl_data))
+    return {"markdown": md_data, "regions": jsonl_data, "removed": removed, "detections": detections,
+            "images": {f"images/{rel}": b for rel, b in writer.images.items()}}
+
+
+def _init_worker(torch_threads, cpu_queue, preload_model=False, model_cache_mb=None):
+    cpus = None
+    if cpu_queue is not None:
         try:
-            trim_sides(str(src_pdf), str(pre_pdf), top=0.05)
-            clean_line_number(str(pre_pdf), str(tmp_pdf))
+            cpus = cpu_queue.get_nowait()
         except Exception:
-            continue
+            pass
+    apply_runtime(torch_threads=torch_threads, cpus=cpus)
+    configure_models(max_memory_mb=model_cache_mb)
+    if preload_model:
+        # preload_model: True for the default weights, or a weights path
+        get_model(preload_model if isinstance(preload_model, str) else DEFAULT_WEIGHTS)
 
-    image_folder = f'{output_folder}/outputs/images'
-    md_folder = f'{output_folder}/outputs'
-    jsonl_folder = f'{output_folder}/raw_outputs'
-    removed_folder = f'{output_folder}/removed'
 
-    Path(image_folder).mkdir(parents=True, exist_ok=True)
-    Path(md_folder).mkdir(parents=True, exist_ok=True)
-    Path(jsonl_folder).mkdir(parents=True, exist_ok=True)
-    Path(removed_folder).mkdir(parents=True, exist_ok=True)
+def make_pool(workers, torch_threads=None, pin_cpus=False, preload_model=False, doc_timeout=None,
+              doc_memory_mb=None, model_cache_mb=None):
+    # None means "run documents in this process"; the runtime settings are applied here instead.
+    # Budgets need a separate process that can be killed, so they always get a (supervised) pool.
+    if workers <= 1 and not (doc_timeout or doc_memory_mb):
+        apply_runtime(torch_threads=torch_threads, cpus=cpu_sets(1, torch_threads)[0] if pin_cpus else None)
+        configure_models(max_memory_mb=model_cache_mb)
+        return None
 
-    skipped = []
+    workers = max(1, workers)
+    cpu_queue = None
+    if pin_cpus:
+        cpu_queue = multiprocessing.Queue()
+        for cpus in cpu_sets(workers, torch_threads):
+            cpu_queue.put(cpus)
+    return SupervisedPool(workers, initializer=_init_worker,
+                          initargs=(torch_threads, cpu_queue, preload_model, model_cache_mb),
+                          timeout=doc_timeout, max_rss_mb=doc_memory_mb)
 
-    for pdf_file in tqdm(pdf_files, desc="run YOLO on prepared PDFs", unit="file"):
-        pdf_name = pdf_file[:-4]
-        yolo_pdf = temp_dir / pdf_file
 
-        res_dir = Path(image_folder) / pdf_name
-        shutil.rmtree(res_dir, ignore_errors=True)
-        res_dir.mkdir(parents=True, exist_ok=True)
+def run_jobs(jobs, pool=None, workers=1, cancel=None, pump=None, memory=None, depth=None):
+    # jobs yields (key, args for _convert_pdf); yields (key, result, error) as documents finish.
+    # No new document is started once `cancel` is set; `pump` is called periodically while waiting.
+    # `memory` (a MemoryGovernor for this process) can lower the number of documents in flight.
+    # depth: documents in flight (default 2 × workers); queue mode uses `workers` so a job is only
+    # leased when a worker is free to start it.
+    if pool is None:
+        for key, args in jobs:
+            if cancel is not None and cancel.is_set():
+                return
+            try:
+                yield key, _convert_pdf(*args), None
+            except Exception as e:
+                yield key, None, e
+        return
 
+    pending = {}
+    jobs = iter(jobs)
+    exhausted = False
+    while pending or not exhausted:
+        # Keep a bounded number of documents in flight so discovery stays streaming.
+        if cancel is not None and cancel.is_set():
+            exhausted = True
+        limit = memory.queue_depth(depth or 2 * workers) if memory is not None else depth or 2 * workers
+        while not exhausted and len(pending) < limit:
+            try:
+                key, args = next(jobs)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[pool.submit(_convert_pdf, *args)] = key
+        if not pending:
+            break
+        done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+        if pump is not None:
+            pump()
+        for fut in done:
+            key = pending.pop(fut)
+            try:
+                yield key, fut.result(), None
+            except Exception as e:
+                yield key, None, e
 
-        jsonl_data = yolo_pipeline(pdf_name, str(yolo_pdf), image_folder)
-        jsonl_data, removed_licenses = license_filter(jsonl_data)
-        jsonl_data, removed_reference = reference_filter(jsonl_data)
 
-        md_data = convert_jsonl_to_md(jsonl_data)
-        with open(Path(md_folder) / f"{pdf_name}.md", "w", encoding="utf-8", newline="\n") as f:
-            f.write(md_data.rstrip() + "\n")
+def link_duplicates(backend, duplicates, output_folder, index=None):
+    # Gives every duplicate input the outputs of its canonical copy and records the mapping.
+    if not duplicates:
+        return
+    linked = 0
+    with open(Path(output_folder) / "duplicates.jsonl", "a", encoding="utf-8") as f:
+        for dup_id, info in duplicates.items():
+            ok = backend.link_document(dup_id, info["canonical"])
+            if index is not None:
+                index.link_document(dup_id, info["canonical"])
+            linked += ok
+            f.write(json.dumps({"doc_id": dup_id, **info, "linked": bool(ok)}, ensure_ascii=False) + "\n")
+    print(f"[INFO] {len(duplicates)} duplicate pdfs skipped, {linked} linked to their canonical outputs")
 
-        if save_raw_json:
-            jsonl_path = Path(jsonl_folder) / f"{pdf_name}.jsonl"
-            with open(jsonl_path, "w", encoding="utf-8") as f:
-                for item in jsonl_data:
-                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
 
-        if save_removed:
-            md_removed_licenses = convert_jsonl_to_md(removed_licenses)
-            with open(Path(removed_folder) / f"{pdf_name}_removed_licenses.md", "w", encoding="utf-8",
-                      newline="\n") as f:
-                f.write(md_removed_licenses.rstrip() + "\n")
+def dry_run(input_folder, recursive=True, shard=None, workers=1, pages_per_sec=None):
+    # Plans the corpus like schedule="lpt" without processing it; returns the estimate as a dict.
+    shard = parse_shard(shard) if isinstance(shard, str) else shard
+    planned = lpt_order(iter_corpus(input_folder, recursive=recursive, shard=shard))
+    pages = sum(t[2] for t in planned)
+    cost = sum(t[3] for t in planned)
+    estimate = {"pdfs": len(planned), "pages": pages, "letter_pages": round(cost, 1), "workers": workers}
+    print(f"[INFO] {len(planned)} pdfs, {pages} pages ({cost:.0f} letter-page equivalents)")
+    for pdf_path, doc_id, n, c in planned[:5]:
+        print(f"   {doc_id}: {n} pages")
+    if not pages_per_sec:
+        print("[INFO] no recorded pages/sec for this machine (run autotune.py or pass --pages-per-sec)")
+        return estimate
+    # pages_per_sec is the aggregate rate of all workers; one document runs at a worker's share of it.
+    per_worker = pages_per_sec / max(1, workers)
+    makespan = lpt_makespan([c / per_worker for _, _, _, c in planned], workers)
+    ideal = cost / pages_per_sec
+    estimate.update(pages_per_sec=pages_per_sec, ideal_seconds=round(ideal, 1), lpt_seconds=round(makespan, 1))
+    fmt = lambda t: time.strftime("%H:%M:%S", time.gmtime(t))
+    print(f"[INFO] at {pages_per_sec:.2f} pages/s: ~{fmt(makespan)} wall-clock with LPT order "
+          f"(perfectly balanced: {fmt(ideal)})")
+    return estimate
 
-            md_removed_reference = convert_jsonl_to_md(removed_reference)
-            with open(Path(removed_folder) / f"{pdf_name}_removed_reference.md", "w", encoding="utf-8",
-                      newline="\n") as f:
-                f.write(md_removed_reference.rstrip() + "\n")
 
+def export_pdfs_to_mds(input_folder, output_folder, save_raw_json=False, save_removed=False, dedup_images=False,
+                       output_backend="files", shard_size_mb=DEFAULT_SHARD_SIZE_MB, recursive=True, shard=None,
+                       queue_path=None, lease_timeout=3600, max_retries=3, scratch_dir=None, clean_output=None,
+                       workers=1, torch_threads=None, batch_size=BATCH_SIZE, render_scale=RENDER_SCALE,
+                       pin_cpus=False, on_event=None, cancel=None, name_filter=False, ner_model=None,
+                       ner_backend="torch", ner_quantize=False, optimize=False, precision="fp32",
+                       compile_model=False, doc_timeout=None, doc_memory_mb=None,
+                       heavy_page_bytes=HEAVY_PAGE_BYTES, max_pages=None, page_range=None, skip_references=False,
+                       stop_at_references=False, max_memory_mb=None, trace_memory=False, dedup_pdfs=None,
+                       save_detections=False, render_workers=0, schedule="discovery", embedded_images=False,
+                       page_workers=0, split_pages=SPLIT_PAGES, weights_path=DEFAULT_WEIGHTS, model_cache_mb=None,
+                       strip_banners=False, index_path=None, tile_above=None):
+    shard = parse_shard(shard) if isinstance(shard, str) else shard
+    # Workers sharing a queue write into the same output folder, so it must never be wiped there.
+    if clean_output is None:
+        clean_output = queue_path is None
 
+    if clean_output:
+        shutil.rmtree(output_folder, ignore_errors=True)
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
 
-    shutil.rmtree(temp_dir, ignore_errors=True)
+    # Private per-run scratch space: concurrent runs on one host/filesystem never share it.
+    temp_dir = Path(tempfile.mkdtemp(prefix="__cut_tmp__", dir=scratch_dir))
 
+    backend = make_backend(output_backend, output_folder, save_raw_json=save_raw_json, save_removed=save_removed,
+                           dedup_images=dedup_images, shard_size_mb=shard_size_mb)
+    image_folder = f'{output_folder}/outputs/images'
+    yolo_options = {"weights_path": weights_path, "batch_size": batch_size, "render_scale": render_scale,
+                    "optimize": optimize, "precision": precision, "compile_model": compile_model, "heavy_page_bytes": heavy_page_bytes,
+                    "max_pages": max_pages, "skip_references": skip_references,
+                    "stop_at_references": stop_at_references, "render_workers": render_workers,
+                    "embedded_images": embedded_images, "strip_banners": strip_banners,
+                    "tile_above": tile_above, "page_workers": page_workers, "split_pages": split_pages,
+                    "page_range": parse_page_range(page_range) if isinstance(page_range, str) else page_range}
+    ner_options = {"backend": ner_backend, "quantize": ner_quantize}
+    if ner_model:
+        ner_options["model"] = ner_model
+    filter_options = {"name_filter": name_filter, "ner_options": ner_options}
+    memory_options = {"max_memory_mb": max_memory_mb, "trace": trace_memory}
+
+    skipped = []
+    queue = None
+    # Region records of every finished paper go into the SQLite/FTS index, one transaction per paper.
+    index = RegionIndex(index_path) if index_path else None
+
+    # dedup_pdfs: None, "hash" (byte-identical files) or "text" (also same first-page text).
+    duplicates = None
+    corpus = iter_corpus(input_folder, recursive=recursive, shard=shard)
+    if dedup_pdfs:
+        duplicates = DuplicateFilter(by_text=dedup_pdfs == "text")
+        corpus = duplicates.filter(corpus)
+        backend.remember_entries = True
+
+    # schedule: "discovery" streams files in directory order; "lpt" reads page counts/sizes first and
+    # starts the largest documents first.
+    costs = {}
+    if schedule == "lpt":
+        planned = lpt_order(corpus)
+        costs = {doc_id: cost for _, doc_id, _, cost in planned}
+        print(f"[INFO] LPT plan: {len(planned)} pdfs, {sum(t[2] for t in planned)} pages")
+        corpus = [(pdf_path, doc_id) for pdf_path, doc_id, _, _ in planned]
+
+    if queue_path is not None:
+        queue = WorkQueue(queue_path, lease_timeout=lease_timeout, max_retries=max_retries)
+        added = queue.enqueue((doc_id, src, costs.get(doc_id, 0.0)) for src, doc_id in corpus)
+        print(f"[INFO] queue {queue_path}: {added} new jobs, {queue.stats()}")
+        pdf_files = ((Path(job["src"]), job["doc_id"]) for job in queue.iter_leases())
+        # Leases of documents still being converted are renewed until they complete, fail or are released.
+        queue.start_heartbeat()
+    else:
+        pdf_files = corpus
+
+    pool = make_pool(workers, torch_threads=torch_threads, pin_cpus=pin_cpus, doc_timeout=doc_timeout,
+                     doc_memory_mb=doc_memory_mb, model_cache_mb=model_cache_mb)
+    manager = None
+    job_events, job_cancel, pump = on_event, cancel, None
+    if pool is not None and (on_event is not None or cancel is not None):
+        # Pool workers can't call back into this process: relay events and the cancel flag via a manager.
+        manager = multiprocessing.Manager()
+        event_queue = manager.Queue()
+        job_events = QueueSink(event_queue) if on_event is not None else None
+        job_cancel = manager.Event() if cancel is not None else None
+
+        def pump():
+            if on_event is not None:
+                drain(event_queue, on_event)
+            if cancel is not None and cancel.is_set():
+                job_cancel.set()
+
+    jobs = (((src_pdf, pdf_name),
+             (src_pdf, pdf_name, temp_dir, image_folder, backend.image_writer(pdf_name), yolo_options,
+              job_events, job_cancel, filter_options, memory_options, save_detections or bool(index_path)))
+            for src_pdf, pdf_name in pdf_files)
+
+    cancelled = False
+    try:
+        parent_memory = MemoryGovernor(max_memory_mb) if pool is not None and max_memory_mb else None
+        results = run_jobs(jobs, pool=pool, workers=workers, cancel=cancel, pump=pump, memory=parent_memory,
+                           depth=workers if queue is not None else None)
+        for (src_pdf, pdf_name), result, error in tqdm(results, desc="Processing PDFs", unit="file"):
+            if isinstance(error, Cancelled):
+                cancelled = True
+                if queue is not None:
+                    queue.release(pdf_name)
+                continue
+            if error is None:
+                try:
+                    md_data, jsonl_data, removed, writer, detections = result
+                    backend.write_document(pdf_name, md_data, jsonl_data, removed, writer=writer,
+                                           detections=detections if save_detections else None)
+                    if index is not None:
+                        index.index_document(pdf_name, detections)
+                except Exception as e:
+                    error = e
+
+            if error is None:
+                if queue is not None:
+                    queue.complete(pdf_name)
+                continue
+
+            reason = f"{type(error).__name__}: {error}"
+            emit(on_event, "doc_failed", doc=pdf_name, error=reason)
+            skipped.append(f"{src_pdf}: {reason}")
+            if queue is not None:
+                queue.fail(pdf_name, reason)
+        if pump is not None:
+            pump()
+        if duplicates is not None:
+            link_duplicates(backend, duplicates.duplicates, output_folder, index=index)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+        backend.close()
+        if index is not None:
+            index.close()
+        if queue is not None:
+            print(f"[INFO] queue {queue_path}: {queue.stats()}")
+            queue.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if cancelled or (cancel is not None and cancel.is_set()):
+        print("[INFO] run cancelled")
+        emit(on_event, "cancelled")
     print(f'failed to process {len(skipped)} pdfs')
     return skipped
-
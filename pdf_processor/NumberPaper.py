@@ -1,122 +1,202 @@
-import re, statistics, io, contextlib
+import re, io, contextlib
 import shutil
 
 import fitz
+import numpy as np
 
+RX_NUM = re.compile(r"^\d{1,4}[.)]?$")
+RX_ALPHA = re.compile(r"[A-Za-z]")
+RX_NON_DIGIT = re.compile(r"\D")
+DETECT_PAGES = 3
+STRIP_PAD = 1.2
 
-def is_numbered_pdf(pdf_path):
-    RX = re.compile(r"^\d{1,4}[.)]?$")
-
-    def get_words(p):
-        buf = io.StringIO()
-        with contextlib.redirect_stderr(buf):
-            try:
-                return p.get_text("words")
-            except:
-                return []
-
-    def side_score(words, side, W, side_band_frac=0.15, max_band_width_frac=0.12, min_hits=8, min_increase_frac=0.60):
-        band = ([w for w in words if w[2] <= W * side_band_frac] if side == "left"
-                else [w for w in words if w[0] >= W * (1 - side_band_frac)])
-        ds = [w for w in band if RX.match(w[4])]
-        if len(ds) < min_hits: return 0
-        x0, x1 = min(w[0] for w in ds), max(w[2] for w in ds)
-        if (x1 - x0) / max(W, 1e-6) > max_band_width_frac: return 0
-        seq = sorted(ds, key=lambda w: (w[1], w[0]))
-        inc = tot = 0;
-        last = None
-        for w in seq:
-            s = re.sub(r"\D", "", w[4])
-            if not s: continue
-            n = int(s)
-            if last is not None:
-                tot += 1
-                if n > last: inc += 1
-            last = n
-        return 1 if (tot and inc / tot >= min_increase_frac) else 0
 
+def _get_words(p):
+    buf = io.StringIO()
+    with contextlib.redirect_stderr(buf):
+        try:
+            return p.get_text("words")
+        except:
+            return []
+
+
+def page_words(page):
+    # Word boxes of a page as arrays; the only per-token Python work is classifying the strings once.
+    words = _get_words(page)
+    if not words:
+        return None
+    texts = [w[4] for w in words]
+    digits = [RX_NON_DIGIT.sub("", t) for t in texts]
+    return {
+        "W": page.rect.width,
+        "H": page.rect.height,
+        "boxes": np.array([w[:4] for w in words], dtype=np.float64),
+        # strict: the whole token is a line number ("12", "12.", "12)"); value: its digits, -1 if none/too long
+        "strict": np.fromiter((bool(RX_NUM.match(t)) for t in texts), dtype=bool, count=len(texts)),
+        "value": np.fromiter((int(d) if 1 <= len(d) <= 4 else -1 for d in digits), dtype=np.int64,
+                             count=len(texts)),
+        "alpha": np.fromiter((bool(RX_ALPHA.search(t)) for t in texts), dtype=bool, count=len(texts)),
+    }
+
+
+def side_score(pw, side, side_band_frac=0.15, max_band_width_frac=0.12, min_hits=8, min_increase_frac=0.60):
+    b, W = pw["boxes"], pw["W"]
+    band = b[:, 2] <= W * side_band_frac if side == "left" else b[:, 0] >= W * (1 - side_band_frac)
+    m = band & pw["strict"]
+    if m.sum() < min_hits:
+        return 0
+    ds = b[m]
+    if (ds[:, 2].max() - ds[:, 0].min()) / max(W, 1e-6) > max_band_width_frac:
+        return 0
+    # Reading order (top to bottom, then left to right); line numbers mostly increase along it.
+    steps = np.diff(pw["value"][m][np.lexsort((ds[:, 0], ds[:, 1]))])
+    return 1 if (len(steps) and (steps > 0).mean() >= min_increase_frac) else 0
+
+
+def detect_side(first_pages):
+    # first_pages: page_words() of the first few pages; all of them must agree on one numbered side.
+    sides = []
+    for pw in first_pages:
+        if pw is None:
+            return None
+        sl = side_score(pw, "left")
+        sr = side_score(pw, "right")
+        if sl > 0 and sr == 0:
+            sides.append("left")
+        elif sr > 0 and sl == 0:
+            sides.append("right")
+        else:
+            return None
+    if sides and len(set(sides)) == 1:
+        return sides[0]
+    return None
+
+
+def is_numbered_pdf(pdf_path):
     with fitz.open(pdf_path) as doc:
-        k = min(3, len(doc))
-        if k == 0: return False, None
-        sides = []
-        for i in range(k):
-            p = doc.load_page(i)
-            W = p.rect.width
-            words = get_words(p)
-            if not words:
-                sides.append(None);
-                continue
-            sl = side_score(words, "left", W)
-            sr = side_score(words, "right", W)
-            if sl > 0 and sr == 0:
-                sides.append("left")
-            elif sr > 0 and sl == 0:
-                sides.append("right")
-            else:
-                sides.append(None)
-        if all(s is not None for s in sides) and len(set(sides)) == 1:
-            return True, sides[0]
-        return False, None
+        side = detect_side([page_words(doc[i]) for i in range(min(DETECT_PAGES, len(doc)))])
+    return side is not None, side
 
 
-def _clean_margin(input_pdf_path, output_pdf_path, which="left"):
-    doc = fitz.open(input_pdf_path)
-    for page in doc:
-        W, H = page.rect.width, page.rect.height
-        words = page.get_text("words")
-        if not words: continue
-        body_heights = [(y1 - y0) for x0, y0, x1, y1, t, *_ in words if re.search(r"[A-Za-z]", t)]
-        h_med = statistics.median(body_heights) if body_heights else None
-        h_min = max(3.0, 0.5 * h_med) if h_med else 3.0
-        h_max = min(0.12 * H, 1.7 * h_med) if h_med else 0.12 * H
-        cands = []
-        for x0, y0, x1, y1, t, *_ in words:
-            s = re.sub(r"\D", "", t.strip())
-            if not (s.isdigit() and 1 <= len(s) <= 4): continue
-            w = x1 - x0;
-            h = y1 - y0
-            if h <= 0 or w <= 0: continue
-            if not (h_min <= h <= h_max): continue
-            cx = 0.5 * (x0 + x1)
-            if which == "left":
-                if cx > 0.30 * W: continue
-            else:
-                if cx < 0.70 * W: continue
-            cands.append((x0, y0, x1, y1, cx))
-        if len(cands) < 3: continue
-        cxs = [c[4] for c in cands]
-        med = statistics.median(cxs)
-        mad = statistics.median([abs(x - med) for x in cxs]) or (0.002 * W)
-        xtol = max(2.0, 4.0 * mad, 0.006 * W)
-        xtol = min(xtol, 0.02 * W)
-        strip = [c for c in cands if abs(c[4] - med) <= xtol]
-        if len(strip) < 3: continue
-        ys = [s[1] for s in strip] + [s[3] for s in strip]
-        v_cov = (max(ys) - min(ys)) / max(H, 1e-6)
-        if v_cov < 0.25: continue
-        pad = 1.2
-        for x0, y0, x1, y1, _ in strip:
-            page.add_redact_annot(fitz.Rect(x0 - pad, y0 - pad, x1 + pad, y1 + pad), fill=(1, 1, 1))
+def _candidates(pw, which):
+    b, W, H = pw["boxes"], pw["W"], pw["H"]
+    w = b[:, 2] - b[:, 0]
+    h = b[:, 3] - b[:, 1]
+    body = h[pw["alpha"]]
+    h_med = float(np.median(body)) if len(body) else None
+    h_min = max(3.0, 0.5 * h_med) if h_med else 3.0
+    h_max = min(0.12 * H, 1.7 * h_med) if h_med else 0.12 * H
+    cx = 0.5 * (b[:, 0] + b[:, 2])
+    in_margin = cx <= 0.30 * W if which == "left" else cx >= 0.70 * W
+    m = (pw["value"] >= 0) & (w > 0) & (h > 0) & (h >= h_min) & (h <= h_max) & in_margin
+    return b[m], cx[m]
+
+
+def _column(cx, W):
+    med = float(np.median(cx))
+    mad = float(np.median(np.abs(cx - med))) or (0.002 * W)
+    xtol = max(2.0, 4.0 * mad, 0.006 * W)
+    return med, min(xtol, 0.02 * W)
+
+
+def _strip(boxes, cx, column, H):
+    med, xtol = column
+    s = boxes[np.abs(cx - med) <= xtol]
+    if len(s) < 3:
+        return None
+    if (s[:, 3].max() - s[:, 1].min()) / max(H, 1e-6) < 0.25:
+        return None
+    return s
+
+
+def find_line_number_strips(doc, which=None):
+    """
+    Finds the line-number strips of an open document without changing it.
+    The numbered side is detected once from the first pages (unless `which`
+    is given) and the strip column (median centre and tolerance) is learned
+    once from the candidates of those pages, then reused on every page; a
+    page whose numbers don't fit the learned column gets its own. Returns
+    (side, {page_number (1-based): [fitz.Rect, ...]}).
+    """
+    cache = {}
+
+    def words(i):
+        if i not in cache:
+            cache[i] = page_words(doc[i])
+        return cache[i]
+
+    k = min(DETECT_PAGES, len(doc))
+    if which is None:
+        which = detect_side([words(i) for i in range(k)])
+        if which is None:
+            return None, {}
+
+    learned = None
+    seed = [_candidates(words(i), which) for i in range(k) if words(i) is not None]
+    seed_cx = np.concatenate([cx for _, cx in seed]) if seed else np.empty(0)
+    if len(seed_cx) >= 3:
+        learned = _column(seed_cx, max(words(i)["W"] for i in range(k) if words(i) is not None))
+
+    strips = {}
+    for i in range(len(doc)):
+        pw = words(i)
+        cache.pop(i, None)
+        if pw is None:
+            continue
+        boxes, cx = _candidates(pw, which)
+        if len(boxes) < 3:
+            continue
+        s = _strip(boxes, cx, learned, pw["H"]) if learned else None
+        if s is None:
+            s = _strip(boxes, cx, _column(cx, pw["W"]), pw["H"])
+        if s is None:
+            continue
+        p = STRIP_PAD
+        strips[i + 1] = [fitz.Rect(x0 - p, y0 - p, x1 + p, y1 + p) for x0, y0, x1, y1 in s.tolist()]
+    return which, strips
+
+
+def _redact(doc, strips):
+    for pno, rects in strips.items():
+        page = doc[pno - 1]
+        for rect in rects:
+            page.add_redact_annot(rect, fill=(1, 1, 1))
         page.apply_redactions()
-    doc.save(output_pdf_path, garbage=4, deflate=True)
-    doc.close()
+
+
+def _clean_margin(input_pdf_path, output_pdf_path, which="left"):
+    with fitz.open(input_pdf_path) as doc:
+        _, strips = find_line_number_strips(doc, which=which)
+        _redact(doc, strips)
+        doc.save(output_pdf_path, garbage=4, deflate=True)
+    return strips
 
 
 def clean_left_margin_line_numbers(input_pdf_path, output_pdf_path):
-    _clean_margin(input_pdf_path, output_pdf_path, which="left")
+    return _clean_margin(input_pdf_path, output_pdf_path, which="left")
 
 
 def clean_right_margin_line_numbers(input_pdf_path, output_pdf_path):
-    _clean_margin(input_pdf_path, output_pdf_path, which="right")
+    return _clean_margin(input_pdf_path, output_pdf_path, which="right")
 
 
-def clean_line_number(input_pdf_path, output_pdf_path):
-    ok, side = is_numbered_pdf(input_pdf_path)
-    if not ok:
-        shutil.copy2(input_pdf_path, output_pdf_path)
-        return
+def clean_line_number_bytes(data):
+    # In-memory clean_line_number: PDF bytes in, (cleaned PDF bytes, strips) out; unchanged bytes if unnumbered.
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        _, strips = find_line_number_strips(doc)
+        if not strips:
+            return data, strips
+        _redact(doc, strips)
+        return doc.tobytes(garbage=4, deflate=True), strips
+
 
-    if side == "left":
-        clean_left_margin_line_numbers(input_pdf_path, output_pdf_path)
-    else:
-        clean_right_margin_line_numbers(input_pdf_path, output_pdf_path)
+def clean_line_number(input_pdf_path, output_pdf_path=None, inspect_only=False):
+    # Returns the strips found ({page_number: [Rect]}); with inspect_only nothing is redacted or written.
+    with fitz.open(input_pdf_path) as doc:
+        _, strips = find_line_number_strips(doc)
+        if strips and not inspect_only:
+            _redact(doc, strips)
+            doc.save(output_pdf_path, garbage=4, deflate=True)
+    if not strips and not inspect_only:
+        shutil.copy2(input_pdf_path, output_pdf_path)
+    return strips
@@ -0,0 +1,83 @@
+import re
+
+from text_filters.ReferenceFilter import ref_score
+
+RX_REF_HEADING = re.compile(r"^\s*(?:[\dIVX]+\.?\s*)?(references|bibliography|literature cited|works cited)\s*$",
+                            re.I | re.M)
+# A page is reference-like when most of its text blocks score like bibliography entries.
+REF_BLOCK_SCORE = 1.0
+REF_PAGE_FRACTION = 0.6
+
+
+def parse_page_range(spec):
+    # "1-10,15,20-" → [(1, 10), (15, 15), (20, None)]; 1-based, inclusive, open end allowed.
+    ranges = []
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                a, b = part.split("-", 1)
+                start, end = int(a) if a.strip() else 1, int(b) if b.strip() else None
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range {spec!r}, expected e.g. '1-10,15,20-'")
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"Invalid page range {spec!r}, expected e.g. '1-10,15,20-'")
+        ranges.append((start, end))
+    return ranges
+
+
+def _in_ranges(pno, ranges):
+    return any(start <= pno and (end is None or pno <= end) for start, end in ranges)
+
+
+def has_reference_heading(page):
+    return bool(RX_REF_HEADING.search(page.get_text("text")))
+
+
+def is_reference_page(page):
+    blocks = [b[4] for b in page.get_text("blocks") if b[6] == 0 and len(b[4].strip()) >= 20]
+    if not blocks:
+        return False
+    refs = sum(1 for text in blocks if ref_score(text) > REF_BLOCK_SCORE)
+    return refs / len(blocks) >= REF_PAGE_FRACTION
+
+
+def plan_pages(doc, max_pages=None, page_range=None, skip_references=False, stop_at_references=False):
+    """
+    Picks the (1-based) page numbers worth sending to the layout model, using
+    only the text layer. `page_range` and `max_pages` restrict the pages
+    directly. With `skip_references`, pages after a References/Bibliography
+    heading that are dense with reference-like blocks are skipped; with
+    `stop_at_references`, every page after the heading page is dropped
+    (bibliography and appendices alike). The heading page itself is kept so
+    the end of the body text survives.
+    """
+    pages = list(range(1, len(doc) + 1))
+    if page_range:
+        ranges = parse_page_range(page_range) if isinstance(page_range, str) else page_range
+        pages = [p for p in pages if _in_ranges(p, ranges)]
+
+    if skip_references or stop_at_references:
+        planned = []
+        in_refs = False
+        for pno in pages:
+            page = doc[pno - 1]
+            if in_refs:
+                if stop_at_references:
+                    break
+                if is_reference_page(page):
+                    continue
+                in_refs = False
+            # A heading on the first page is a table of contents or a template, not the bibliography.
+            if pno > 1 and has_reference_heading(page):
+                in_refs = True
+            planned.append(pno)
+        pages = planned
+
+    if max_pages:
+        pages = pages[:max_pages]
+    return pages
@@ -0,0 +1,8 @@
+import fitz
+
+
+def open_pdf(src):
+    # A path, or the bytes of a PDF held in memory (library use without temp files).
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(src), filetype="pdf")
+    return fitz.open(src)
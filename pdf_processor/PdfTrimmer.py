@@ -1,6 +1,7 @@
 from PyPDF2 import PdfReader, PdfWriter
 
 def trim_sides(input_path, output_path, top=0.0, bottom=0.0, left=0.0, right=0.0):
+    # input_path / output_path may also be binary file objects (e.g. io.BytesIO) for in-memory use.
     reader = PdfReader(input_path)
     writer = PdfWriter()
 
@@ -47,5 +48,8 @@ def trim_sides(input_path, output_path, top=0.0, bottom=0.0, left=0.0, right=0.0
         page.cropbox.upper_right = (new_urx, new_ury)
         writer.add_page(page)
 
+    if hasattr(output_path, "write"):
+        writer.write(output_path)
+        return
     with open(output_path, "wb") as f:
         writer.write(f)
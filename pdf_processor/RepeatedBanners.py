@@ -0,0 +1,76 @@
+import math, re
+
+import fitz
+
+RX_DIGITS = re.compile(r"\d+")
+RX_SPACE = re.compile(r"\s+")
+# Banners are learned from the first LEARN_PAGES planned pages and must sit on MIN_REPEAT of them.
+LEARN_PAGES = 5
+MIN_REPEAT = 0.6
+# Points a repeat may move between pages and still count as the same position.
+POS_TOL = 4.0
+MIN_CHARS = 4
+# A detected region is a banner when this much of it lies inside a learned banner's box.
+MIN_INSIDE = 0.8
+
+
+def _norm(text):
+    # Page numbers and dates change from page to page; the rest of a running banner doesn't.
+    return RX_SPACE.sub(" ", RX_DIGITS.sub("#", text)).strip().lower()
+
+
+def _close(a, b, tol=POS_TOL):
+    return all(abs(u - v) <= tol for u, v in zip(a, b))
+
+
+def learn_banners(doc, pages, learn_pages=LEARN_PAGES, min_repeat=MIN_REPEAT):
+    """
+    Learns a document's running boilerplate (license banners, running
+    headers, watermarks) from the text layer of its first planned pages: a
+    text block is a banner when the same text, up to digits, sits at the same
+    position on at least `min_repeat` of those pages. Returns
+    [{"text", "rect", "pages"}]; nothing is learned from fewer than 3 pages.
+    """
+    sample = pages[:learn_pages]
+    if len(sample) < 3:
+        return []
+    seen = {}
+    for pno in sample:
+        try:
+            blocks = doc[pno - 1].get_text("blocks")
+        except Exception:
+            continue
+        for b in blocks:
+            if b[6] != 0:
+                continue
+            norm = _norm(b[4])
+            if len(norm) >= MIN_CHARS:
+                seen.setdefault(norm, []).append((pno, fitz.Rect(b[:4]), b[4].strip()))
+
+    need = max(2, math.ceil(min_repeat * len(sample)))
+    banners = []
+    for hits in seen.values():
+        if len({pno for pno, _, _ in hits}) < need:
+            continue
+        # The largest group of hits at one position, anchored on each hit in turn.
+        best = max(([h for h in hits if _close(h[1], anchor[1])] for anchor in hits), key=len)
+        pages_hit = {pno for pno, _, _ in best}
+        if len(pages_hit) < need:
+            continue
+        rect = fitz.Rect(best[0][1])
+        for _, r, _ in best[1:]:
+            rect |= r
+        banners.append({"text": best[0][2], "rect": rect, "pages": len(pages_hit)})
+    return banners
+
+
+def match_banner(rect, banners, min_inside=MIN_INSIDE):
+    # The banner a detected region (page points) lies in, or None.
+    area = rect.width * rect.height
+    if area <= 0:
+        return None
+    for banner in banners:
+        inter = rect & (banner["rect"] + (-POS_TOL, -POS_TOL, POS_TOL, POS_TOL))
+        if not inter.is_empty and inter.width * inter.height >= min_inside * area:
+            return banner
+    return None
@@ -0,0 +1,58 @@
+from markdown_coverter import convert_jsonl_to_md
+from text_filters.LicenseFilter import license_filter
+from text_filters.ReferenceFilter import reference_filter
+from yolo_model.YoloHelper import process_yolo_output
+
+
+def apply_filters_many(docs, filter_options=None):
+    # Filters for several documents -> [(jsonl_data, removed)]; the NER name filter runs once over all of them,
+    # so their candidate records share batched inference calls.
+    filter_options = filter_options or {}
+    results = []
+    for jsonl_data in docs:
+        jsonl_data, removed_licenses = license_filter(jsonl_data)
+        jsonl_data, removed_reference = reference_filter(jsonl_data)
+        results.append((jsonl_data, {"licenses": removed_licenses, "reference": removed_reference}))
+
+    if filter_options.get("name_filter"):
+        # transformers is only imported when the NER filter is actually enabled
+        from text_filters.bert_filter import name_filter_many
+        named = name_filter_many([jsonl_data for jsonl_data, _ in results], **filter_options.get("ner_options", {}))
+        results = [(kept, {**removed, "names": names}) for (_, removed), (kept, names) in zip(results, named)]
+    return results
+
+
+def apply_filters(jsonl_data, filter_options=None):
+    return apply_filters_many([jsonl_data], filter_options)[0]
+
+
+def banner_report(detections):
+    # One removed-sections entry per distinct banner text that was stripped before text extraction.
+    texts = dict.fromkeys(r["content"] for r in detections if r.get("banner"))
+    return [{"class": "text", "content": t} for t in texts]
+
+
+def finish_documents(docs, filter_options=None, banners=None):
+    # Text filters and Markdown for the post-processed records of several documents -> [(md_data, jsonl_data, removed)]
+    out = []
+    banners = banners or [None] * len(docs)
+    for (jsonl_data, removed), doc_banners in zip(apply_filters_many(docs, filter_options), banners):
+        if doc_banners:
+            removed["banners"] = doc_banners
+        out.append((convert_jsonl_to_md(jsonl_data), jsonl_data, removed))
+    return out
+
+
+def finish_document(jsonl_data, filter_options=None, banners=None):
+    # Text filters and Markdown for post-processed records -> (md_data, jsonl_data, removed)
+    return finish_documents([jsonl_data], filter_options, banners=[banners])[0]
+
+
+def refilter_detections_many(detections_list, filter_options=None):
+    # Everything after layout detection for several documents, starting from raw get_yolo_output records.
+    docs = [process_yolo_output([r for r in detections if not r.get("banner")]) for detections in detections_list]
+    return finish_documents(docs, filter_options, banners=[banner_report(d) for d in detections_list])
+
+
+def refilter_detections(detections, filter_options=None):
+    return refilter_detections_many([detections], filter_options)[0]
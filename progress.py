@@ -0,0 +1,91 @@
+import queue, threading, time
+
+
+class Cancelled(Exception):
+    pass
+
+
+def emit(on_event, event, **fields):
+    if on_event is not None:
+        on_event({"event": event, "time": time.time(), **fields})
+
+
+def check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+
+class QueueSink:
+    # Picklable event sink for pool workers: events go through a (manager) queue to the parent.
+    def __init__(self, q):
+        self.q = q
+
+    def __call__(self, event):
+        self.q.put(event)
+
+
+def drain(q, on_event):
+    while True:
+        try:
+            event = q.get_nowait()
+        except queue.Empty:
+            return
+        on_event(event)
+
+
+class ThroughputTracker:
+    """
+    Folds pipeline events into live numbers: pages/sec over a sliding window,
+    documents done/failed, and an ETA when the number of documents is known.
+    Thread-safe, so several runs can feed one tracker.
+    """
+
+    def __init__(self, total_docs=None, window=30.0):
+        self.total_docs = total_docs
+        self.window = window
+        self.lock = threading.Lock()
+        self.page_times = []
+        self.docs_done = 0
+        self.docs_failed = 0
+        self.pages_done = 0
+        self.started = time.time()
+
+    def add_total(self, n):
+        with self.lock:
+            self.total_docs = (self.total_docs or 0) + n
+
+    def __call__(self, event):
+        with self.lock:
+            kind = event.get("event")
+            if kind == "page":
+                self.page_times.append(event.get("time", time.time()))
+                self.pages_done += 1
+            elif kind == "doc_done":
+                self.docs_done += 1
+            elif kind == "doc_failed":
+                self.docs_failed += 1
+
+    def pages_per_sec(self):
+        now = time.time()
+        with self.lock:
+            cutoff = now - self.window
+            self.page_times = [t for t in self.page_times if t >= cutoff]
+            span = min(self.window, now - self.started)
+            return len(self.page_times) / span if span > 0 else 0.0
+
+    def eta_seconds(self):
+        pps = self.pages_per_sec()
+        with self.lock:
+            finished = self.docs_done + self.docs_failed
+            if not self.total_docs or not finished or pps <= 0:
+                return None
+            pages_per_doc = self.pages_done / max(1, finished)
+            remaining = max(0, self.total_docs - finished)
+        return remaining * pages_per_doc / pps
+
+    def summary(self):
+        eta = self.eta_seconds()
+        eta_txt = "--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        total = self.total_docs if self.total_docs is not None else "?"
+        return (f"{self.pages_per_sec():.2f} pages/s | docs {self.docs_done}/{total}"
+                f" (failed {self.docs_failed}) | ETA {eta_txt}")
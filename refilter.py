@@ -0,0 +1,129 @@
+# refilter.py
+import argparse, json, os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from tqdm import tqdm
+
+from postprocess import refilter_detections_many
+from storage.OutputBackend import FileBackend
+
+
+def _read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Papers per worker task; the NER name filter batches its inference across all papers of a task.
+REFILTER_BATCH = 32
+
+
+def _error(e):
+    return f"{type(e).__name__}: {e}"
+
+
+def _refilter_batch(detections_paths, output_folder, save_raw_json, save_removed, filter_options):
+    # -> [(pdf_name, error)] in input order; one bad paper does not fail the rest of its batch.
+    errors, loaded = {}, {}
+    for path in detections_paths:
+        try:
+            loaded[Path(path).stem] = _read_records(path)
+        except Exception as e:
+            errors[Path(path).stem] = _error(e)
+
+    names = list(loaded)
+    try:
+        outputs = refilter_detections_many([loaded[n] for n in names], filter_options)
+    except Exception:
+        # Redo the batch paper by paper to find out which one failed.
+        outputs = []
+        for name in names:
+            try:
+                outputs.append(refilter_detections_many([loaded[name]], filter_options)[0])
+            except Exception as e:
+                errors[name] = _error(e)
+                outputs.append(None)
+
+    backend = FileBackend(output_folder, save_raw_json=save_raw_json, save_removed=save_removed)
+    for name, output in zip(names, outputs):
+        if output is None:
+            continue
+        try:
+            backend.write_document(name, *output)
+        except Exception as e:
+            errors[name] = _error(e)
+    return [(Path(p).stem, errors.get(Path(p).stem)) for p in detections_paths]
+
+
+def refilter(dataset_folder, output_folder=None, workers=None, save_raw_json=False, save_removed=False,
+             name_filter=False, ner_options=None):
+    """
+    Regenerates Markdown, region JSONL and removed sections from the detection
+    dumps of an earlier run (`--save-detections`, files backend) without
+    rendering or inference: process_yolo_output, the text filters and the
+    Markdown conversion run again for every paper, spread over `workers`
+    processes in batches of up to REFILTER_BATCH papers (the NER filter runs
+    batched inference across each batch). Outputs are rewritten in place unless `output_folder` is given;
+    image links keep pointing at `outputs/images/` of the original run.
+    Returns the list of papers that failed.
+    """
+    det_dir = Path(dataset_folder) / "detections"
+    if not det_dir.is_dir():
+        raise SystemExit(f"No detections/ in {dataset_folder}; run the pipeline with --save-detections first.")
+    output_folder = output_folder or dataset_folder
+    filter_options = {"name_filter": name_filter, "ner_options": ner_options or {}}
+    paths = sorted(str(p) for p in det_dir.glob("*.jsonl"))
+    workers = workers or os.cpu_count() or 1
+    # Every process loads its own copy of the NER model, so --name-filter runs with fewer of them.
+    if name_filter:
+        workers = min(workers, 2)
+
+    failed = []
+    args = (output_folder, save_raw_json, save_removed, filter_options)
+    # Smaller batches when there are few papers, so every worker still gets some.
+    size = max(1, min(REFILTER_BATCH, -(-len(paths) // workers)))
+    batches = [paths[i:i + size] for i in range(0, len(paths), size)]
+    bar = tqdm(total=len(paths), desc="Refiltering", unit="file")
+
+    def collect(batch):
+        failed.extend(f"{pdf_name}: {error}" for pdf_name, error in batch if error)
+        bar.update(len(batch))
+
+    if workers <= 1:
+        for b in batches:
+            collect(_refilter_batch(b, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futs = [pool.submit(_refilter_batch, b, *args) for b in batches]
+            for fut in futs:
+                collect(fut.result())
+    bar.close()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run post-processing, filters and Markdown from saved detections")
+    parser.add_argument("dataset_folder", help="Output folder of a run made with --save-detections")
+    parser.add_argument("--out", default=None, help="Write here instead of rewriting dataset_folder in place.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores).")
+    parser.add_argument("--save-raw-json", action="store_true", default=False)
+    parser.add_argument("--save-removed", action="store_true", default=False)
+    parser.add_argument("--name-filter", action="store_true")
+    parser.add_argument("--ner-model", default=None)
+    parser.add_argument("--ner-backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--ner-quantize", action="store_true")
+    args = parser.parse_args()
+
+    ner_options = {"backend": args.ner_backend, "quantize": args.ner_quantize}
+    if args.ner_model:
+        ner_options["model"] = args.ner_model
+    failed = refilter(args.dataset_folder, output_folder=args.out, workers=args.workers,
+                      save_raw_json=args.save_raw_json, save_removed=args.save_removed,
+                      name_filter=args.name_filter, ner_options=ner_options)
+    print(f"failed to refilter {len(failed)} papers")
+    for f in failed:
+        print(" -", f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# region_index.py
+import argparse, json, sqlite3, time
+from pathlib import Path
+
+IMAGE_CLASSES = {"picture", "table", "formula"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    doc_id      TEXT PRIMARY KEY,
+    regions     INTEGER NOT NULL,
+    alias_of    TEXT,                               -- duplicate input sharing another paper's regions
+    indexed     REAL
+);
+CREATE TABLE IF NOT EXISTS regions (
+    id          INTEGER PRIMARY KEY,
+    doc_id      TEXT NOT NULL,
+    page        INTEGER,
+    class       TEXT NOT NULL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,             -- render-scale pixels, as in the detections
+    conf        REAL,
+    text        TEXT,                               -- NULL for picture/table/formula regions
+    image       TEXT                                -- their crop, relative to outputs/
+);
+CREATE INDEX IF NOT EXISTS regions_doc ON regions(doc_id, page);
+CREATE INDEX IF NOT EXISTS regions_class ON regions(class);
+CREATE VIRTUAL TABLE IF NOT EXISTS regions_fts USING fts5(text, content='regions', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS regions_ai AFTER INSERT ON regions BEGIN
+    INSERT INTO regions_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS regions_ad AFTER DELETE ON regions BEGIN
+    INSERT INTO regions_fts(regions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+COLUMNS = ("doc_id", "page", "class", "x0", "y0", "x1", "y1", "conf", "text", "image")
+INSERT_REGION = f"INSERT INTO regions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def region_row(doc_id, r):
+    image = r["class"] in IMAGE_CLASSES
+    content = r.get("content") or ""
+    return (doc_id, r.get("page"), r["class"], r.get("x0"), r.get("y0"), r.get("x1"), r.get("y1"), r.get("conf"),
+            None if image else content, content if image else None)
+
+
+class RegionIndex:
+    """
+    SQLite database of every detected region of a corpus (paper, page, class,
+    box, confidence, text or crop path) with an FTS5 index on the text.
+
+    A paper is written in one transaction that replaces its previous rows, so
+    re-running a document never leaves duplicates; the database is in WAL mode
+    so queries can run while a pipeline is still adding papers, and several
+    workers (e.g. in queue mode) can share one file.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.conn = sqlite3.connect(self.db_path, timeout=120, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _tx(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def index_document(self, doc_id, records):
+        # records: detection records of one paper (get_yolo_output); stripped banners are left out.
+        rows = [region_row(doc_id, r) for r in records if not r.get("banner")]
+        self._tx()
+        try:
+            self.conn.execute("DELETE FROM regions WHERE doc_id=?", (doc_id,))
+            self.conn.executemany(INSERT_REGION, rows)
+            self.conn.execute("INSERT OR REPLACE INTO papers (doc_id, regions, alias_of, indexed) "
+                              "VALUES (?, ?, NULL, ?)", (doc_id, len(rows), time.time()))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def link_document(self, doc_id, canonical):
+        # A duplicate input is recorded as an alias; queries report the canonical paper's regions.
+        self.conn.execute("INSERT OR REPLACE INTO papers (doc_id, regions, alias_of, indexed) "
+                          "SELECT ?, regions, doc_id, ? FROM papers WHERE doc_id=?", (doc_id, time.time(), canonical))
+
+    def query(self, text=None, classes=None, doc_id=None, page=None, limit=50):
+        # text: an FTS5 query ('"overall survival"', 'hazard AND ratio', 'surviv*'); results best match first.
+        sql = f"SELECT r.{', r.'.join(COLUMNS)} FROM regions r"
+        where, args = [], []
+        if text:
+            sql += " JOIN regions_fts f ON f.rowid = r.id"
+            where.append("regions_fts MATCH ?")
+            args.append(text)
+        if classes:
+            where.append(f"r.class IN ({', '.join('?' * len(classes))})")
+            args += list(classes)
+        if doc_id:
+            alias = self.conn.execute("SELECT alias_of FROM papers WHERE doc_id=?", (doc_id,)).fetchone()
+            where.append("r.doc_id = ?")
+            args.append(alias[0] if alias and alias[0] else doc_id)
+        if page is not None:
+            where.append("r.page = ?")
+            args.append(page)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + ("f.rank" if text else "r.doc_id, r.page, r.id") + " LIMIT ?"
+        args.append(limit)
+        return [dict(zip(COLUMNS, row)) for row in self.conn.execute(sql, args)]
+
+    def stats(self):
+        papers = self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+        by_class = dict(self.conn.execute("SELECT class, COUNT(*) FROM regions GROUP BY class ORDER BY 2 DESC"))
+        return {"papers": papers, "regions": sum(by_class.values()), "classes": by_class}
+
+
+def index_folder(dataset_folder, db_path):
+    # Indexes the detection dumps of an earlier run (--save-detections, files backend).
+    det_dir = Path(dataset_folder) / "detections"
+    if not det_dir.is_dir():
+        raise SystemExit(f"No detections/ in {dataset_folder}; run the pipeline with --save-detections first.")
+    index = RegionIndex(db_path)
+    try:
+        n = 0
+        for path in sorted(det_dir.glob("*.jsonl")):
+            with open(path, "r", encoding="utf-8") as f:
+                index.index_document(path.stem, [json.loads(line) for line in f if line.strip()])
+            n += 1
+        print(f"[INFO] indexed {n} papers → {db_path}: {index.stats()}")
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the SQLite/FTS5 index of extracted regions")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    build = sub.add_parser("build", help="Index the detections/ of a run made with --save-detections")
+    build.add_argument("dataset_folder")
+    build.add_argument("db")
+    q = sub.add_parser("query", help="Search the index")
+    q.add_argument("db")
+    q.add_argument("text", nargs="?", default=None, help="FTS5 query on the region text, e.g. '\"overall survival\"'.")
+    q.add_argument("--class", dest="classes", action="append", default=None,
+                   help="Only regions of this class (repeatable), e.g. --class table --class picture.")
+    q.add_argument("--paper", default=None, help="Only this paper id.")
+    q.add_argument("--page", type=int, default=None)
+    q.add_argument("--limit", type=int, default=50)
+    q.add_argument("--json", action="store_true", help="One JSON record per line instead of a summary.")
+    st = sub.add_parser("stats", help="Papers and regions per class")
+    st.add_argument("db")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        index_folder(args.dataset_folder, args.db)
+        return
+    index = RegionIndex(args.db)
+    try:
+        if args.cmd == "stats":
+            print(json.dumps(index.stats(), indent=2, ensure_ascii=False))
+            return
+        t0 = time.perf_counter()
+        rows = index.query(text=args.text, classes=args.classes, doc_id=args.paper, page=args.page,
+                           limit=args.limit)
+        for r in rows:
+            if args.json:
+                print(json.dumps(r, ensure_ascii=False))
+            else:
+                what = r["image"] or " ".join((r["text"] or "").split())[:100]
+                print(f"{r['doc_id']}  p{r['page']}  {r['class']:<14} {what}")
+        print(f"[INFO] {len(rows)} regions in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import argparse, hashlib, json, os, time
+from pathlib import Path
+
+STORE_DIRNAME = "_objects"
+# gc() leaves objects younger than this alone: a worker may have put them without committing its refs yet.
+GC_GRACE_SECONDS = 24 * 3600
+
+
+def pixel_hash(im):
+    # Keyed on decoded pixels, so identical crops dedupe regardless of source page/file.
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{im.mode}:{im.size[0]}x{im.size[1]}:".encode())
+    h.update(im.tobytes())
+    return h.hexdigest()
+
+
+def _atomic_write(path, write_fn):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write_fn(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class ImageStore:
+    """
+    Content-addressed store for region crops, shared by every paper of a dataset.
+
+    Layout under <image_folder>/_objects/:
+        ab/abcdef....png      one object per distinct pixel hash
+        cd/cdef01....jpeg     one per distinct embedded image (key includes the extension)
+        refs/<pdf_name>.json  the hashes a paper links to
+
+    A paper's refs live in their own file, so concurrent workers never rewrite
+    a shared index; the reference count of an object is the number of ref files
+    naming it. put() refreshes the mtime of an object it reuses, and gc()
+    removes only unreferenced objects older than a grace period, so objects a
+    running worker has put but not committed yet survive. Runs never gc on
+    their own; run `python -m storage.ImageStore <output_folder>` when no job
+    writes to the store.
+    """
+
+    def __init__(self, image_folder):
+        self.image_folder = Path(image_folder)
+        self.root = self.image_folder / STORE_DIRNAME
+        self.refs_dir = self.root / "refs"
+        self.refs_dir.mkdir(parents=True, exist_ok=True)
+
+    def _object_path(self, key):
+        # Keys of encoded objects carry their extension ("<hash>.jpeg"); pixel-hash keys are PNGs.
+        name = key if "." in key else f"{key}.png"
+        return self.root / key[:2] / name
+
+    def _store(self, key, write_fn):
+        path = self._object_path(key)
+        try:
+            # Reused object: a fresh mtime keeps it out of a concurrent gc until our refs are committed.
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _atomic_write(path, write_fn)
+        return key
+
+    def put(self, im):
+        return self._store(pixel_hash(im), lambda tmp: im.save(tmp, format="PNG"))
+
+    def put_bytes(self, data, ext):
+        # Already encoded image, keyed on its bytes (so it never collides with a pixel-hash key).
+        key = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}.{ext}"
+        return self._store(key, lambda tmp: tmp.write_bytes(data))
+
+    def link(self, key):
+        return f"images/{self._object_path(key).relative_to(self.image_folder).as_posix()}"
+
+    def commit(self, pdf_name, keys):
+        ref_path = self.refs_dir / f"{pdf_name}.json"
+        data = json.dumps(sorted(set(keys)))
+        _atomic_write(ref_path, lambda tmp: tmp.write_text(data, encoding="utf-8"))
+
+    def release(self, pdf_name):
+        ref_path = self.refs_dir / f"{pdf_name}.json"
+        if ref_path.exists():
+            ref_path.unlink()
+
+    def ref_counts(self):
+        counts = {}
+        for ref_path in self.refs_dir.glob("*.json"):
+            for key in json.loads(ref_path.read_text(encoding="utf-8")):
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def gc(self, grace_seconds=GC_GRACE_SECONDS):
+        # An unreferenced old object is first renamed aside. A put() that touched it before the rename left a
+        # fresh mtime and it is put back; a put() after the rename finds no object and writes it again. Only
+        # objects still old and unreferenced (refs read again after the renames) are deleted.
+        cutoff = time.time() - grace_seconds
+        old = [p for p in self.root.glob("??/*.*") if not p.name.startswith(".") and p.stat().st_mtime < cutoff]
+        counts = self.ref_counts()
+        aside = []
+        for path in old:
+            if counts.get(path.stem, 0) == 0 and counts.get(path.name, 0) == 0:
+                trash = path.with_name(f".{path.name}.gc")
+                try:
+                    os.replace(path, trash)
+                except FileNotFoundError:
+                    continue
+                aside.append((path, trash))
+        counts = self.ref_counts()
+        removed = 0
+        for path, trash in aside:
+            if path.exists():
+                # Written again by a put() meanwhile; the copy set aside is the same bytes.
+                trash.unlink()
+                continue
+            if trash.stat().st_mtime >= cutoff or counts.get(path.stem, 0) or counts.get(path.name, 0):
+                os.replace(trash, path)
+                continue
+            trash.unlink()
+            removed += 1
+        return removed
+
+    def writer(self, pdf_name):
+        return StoreImageWriter(self, pdf_name)
+
+
+class StoreImageWriter:
+    # Drop-in for DiskImageWriter: crops go to the shared store, links point at the object.
+    def __init__(self, store, pdf_name):
+        self.store = store
+        self.pdf_name = pdf_name
+        self.keys = []
+
+    def write(self, rel, im):
+        key = self.store.put(im)
+        self.keys.append(key)
+        return self.store.link(key)
+
+    def write_bytes(self, rel, data):
+        key = self.store.put_bytes(data, rel.rsplit(".", 1)[-1])
+        self.keys.append(key)
+        return self.store.link(key)
+
+    def commit(self):
+        self.store.commit(self.pdf_name, self.keys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove unreferenced objects from the --dedup-images store")
+    parser.add_argument("output_folder", help="Output folder of runs made with --dedup-images")
+    parser.add_argument("--grace-hours", type=float, default=GC_GRACE_SECONDS / 3600,
+                        help="Keep unreferenced objects younger than this (default 24).")
+    args = parser.parse_args()
+    store = ImageStore(Path(args.output_folder) / "outputs" / "images")
+    print(f"[INFO] removed {store.gc(args.grace_hours * 3600)} unreferenced images from the store")
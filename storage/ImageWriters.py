@@ -0,0 +1,39 @@
+import io
+
+
+class DiskImageWriter:
+    # Default crop sink: one PNG per region under output_path/<pdf_name>/
+    def __init__(self, output_path):
+        self.output_path = output_path
+
+    def write(self, rel, im):
+        im.save(f"{self.output_path}/{rel}")
+        return f"images/{rel}"
+
+    def write_bytes(self, rel, data):
+        # Already encoded image (e.g. a bitmap extracted from the PDF), written as is.
+        with open(f"{self.output_path}/{rel}", "wb") as f:
+            f.write(data)
+        return f"images/{rel}"
+
+    def commit(self):
+        pass
+
+
+class MemoryImageWriter:
+    # Keeps encoded crops in memory (rel -> PNG bytes) instead of touching the filesystem.
+    def __init__(self):
+        self.images = {}
+
+    def write(self, rel, im):
+        buf = io.BytesIO()
+        im.save(buf, format="PNG")
+        self.images[rel] = buf.getvalue()
+        return f"images/{rel}"
+
+    def write_bytes(self, rel, data):
+        self.images[rel] = data
+        return f"images/{rel}"
+
+    def commit(self):
+        pass
@@ -0,0 +1,218 @@
+import io, json, os, shutil, socket, tarfile, time
+from pathlib import Path
+
+from markdown_coverter import convert_jsonl_to_md
+from storage.ImageStore import ImageStore
+from storage.ImageWriters import DiskImageWriter, MemoryImageWriter
+
+DEFAULT_SHARD_SIZE_MB = 512
+
+
+def _records_to_jsonl(records):
+    return "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in records)
+
+
+def _md_text(md_data):
+    return md_data.rstrip() + "\n"
+
+
+class FileBackend:
+    """
+    Default layout, one file per artifact:
+
+        outputs/<pdf_name>.md
+        outputs/images/<pdf_name>/p001_picture01.png   (or outputs/images/_objects/ with dedup_images)
+        raw_outputs/<pdf_name>.jsonl
+        removed/<pdf_name>_removed_<kind>.md
+        detections/<pdf_name>.jsonl                    (unfiltered YOLO records, with save_detections)
+    """
+
+    def __init__(self, output_folder, save_raw_json=False, save_removed=False, dedup_images=False):
+        self.save_raw_json = save_raw_json
+        self.save_removed = save_removed
+        self.md_folder = Path(output_folder) / "outputs"
+        self.image_folder = self.md_folder / "images"
+        self.jsonl_folder = Path(output_folder) / "raw_outputs"
+        self.removed_folder = Path(output_folder) / "removed"
+        self.detections_folder = Path(output_folder) / "detections"
+
+        for d in (self.image_folder, self.md_folder, self.jsonl_folder, self.removed_folder):
+            d.mkdir(parents=True, exist_ok=True)
+
+        self.store = ImageStore(self.image_folder) if dedup_images else None
+
+    def image_writer(self, pdf_name):
+        if self.store is not None:
+            self.store.release(pdf_name)
+            return self.store.writer(pdf_name)
+
+        res_dir = self.image_folder / pdf_name
+        shutil.rmtree(res_dir, ignore_errors=True)
+        res_dir.mkdir(parents=True, exist_ok=True)
+        return DiskImageWriter(str(self.image_folder))
+
+    def write_document(self, pdf_name, md_data, jsonl_data, removed, writer=None, detections=None):
+        if writer is not None:
+            writer.commit()
+
+        if detections is not None:
+            self.detections_folder.mkdir(exist_ok=True)
+            with open(self.detections_folder / f"{pdf_name}.jsonl", "w", encoding="utf-8") as f:
+                f.write(_records_to_jsonl(detections))
+
+        with open(self.md_folder / f"{pdf_name}.md", "w", encoding="utf-8", newline="\n") as f:
+            f.write(_md_text(md_data))
+
+        if self.save_raw_json:
+            with open(self.jsonl_folder / f"{pdf_name}.jsonl", "w", encoding="utf-8") as f:
+                f.write(_records_to_jsonl(jsonl_data))
+
+        if self.save_removed:
+            for kind, items in removed.items():
+                with open(self.removed_folder / f"{pdf_name}_removed_{kind}.md", "w", encoding="utf-8",
+                          newline="\n") as f:
+                    f.write(_md_text(convert_jsonl_to_md(items)))
+
+    def link_document(self, pdf_name, canonical):
+        # Outputs of a duplicate input point at the canonical copy's: hard links where possible, copies otherwise.
+        # Image links in the Markdown already refer to the canonical copy's images, so those are shared as is.
+        pairs = [(self.md_folder / f"{canonical}.md", self.md_folder / f"{pdf_name}.md"),
+                 (self.jsonl_folder / f"{canonical}.jsonl", self.jsonl_folder / f"{pdf_name}.jsonl")]
+        pairs += [(p, self.removed_folder / p.name.replace(f"{canonical}_removed_", f"{pdf_name}_removed_", 1))
+                  for p in self.removed_folder.glob(f"{canonical}_removed_*.md")]
+        if not pairs[0][0].exists():
+            return False
+        for src, dst in pairs:
+            if not src.exists():
+                continue
+            dst.unlink(missing_ok=True)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+        return True
+
+    def close(self):
+        # The crop store is shared with other runs and workers; it is only collected on request
+        # (python -m storage.ImageStore).
+        pass
+
+
+class TarShardBackend:
+    """
+    WebDataset-style tar shards under <output_folder>/shards/.
+
+    Each paper contributes `<id>.md`, `<id>.jsonl` (region records), optionally
+    `<id>.removed_<kind>.md`, and its crops as `images/<id>/...`, so extracting a
+    shard reproduces the Markdown links of the file layout. Shards roll over at
+    `shard_size_mb`. Every writer appends to its own `index-<writer_id>.jsonl`
+    with the shard name and (offset, size) of each member, which is enough to
+    read one paper back without scanning the tar (see read_document).
+    """
+
+    def __init__(self, output_folder, save_removed=False, shard_size_mb=DEFAULT_SHARD_SIZE_MB, writer_id=None):
+        self.save_removed = save_removed
+        self.shard_dir = Path(output_folder) / "shards"
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_bytes = int(shard_size_mb * 1024 * 1024)
+        self.writer_id = writer_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.index = open(self.shard_dir / f"index-{self.writer_id}.jsonl", "a", encoding="utf-8")
+        self.shard_no = -1
+        self.tar = None
+        self.shard_name = None
+        # Only kept when duplicates are linked (link_document); a long run would otherwise hold every entry.
+        self.remember_entries = False
+        self.entries = {}
+
+    def image_writer(self, pdf_name):
+        return MemoryImageWriter()
+
+    def _roll(self):
+        if self.tar is not None:
+            self.tar.close()
+        self.shard_no += 1
+        self.shard_name = f"{self.writer_id}-{self.shard_no:06d}.tar"
+        self.tar = tarfile.open(self.shard_dir / self.shard_name, "w", format=tarfile.PAX_FORMAT)
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        header = info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors)
+        offset = self.tar.offset + len(header)
+        self.tar.addfile(info, io.BytesIO(data))
+        return [offset, len(data)]
+
+    def write_document(self, pdf_name, md_data, jsonl_data, removed, writer=None, detections=None):
+        if self.tar is None or self.tar.offset >= self.shard_bytes:
+            self._roll()
+
+        members = {
+            f"{pdf_name}.md": self._add(f"{pdf_name}.md", _md_text(md_data).encode("utf-8")),
+            f"{pdf_name}.jsonl": self._add(f"{pdf_name}.jsonl", _records_to_jsonl(jsonl_data).encode("utf-8")),
+        }
+        if detections is not None:
+            name = f"{pdf_name}.detections.jsonl"
+            members[name] = self._add(name, _records_to_jsonl(detections).encode("utf-8"))
+        if self.save_removed:
+            for kind, items in removed.items():
+                name = f"{pdf_name}.removed_{kind}.md"
+                members[name] = self._add(name, _md_text(convert_jsonl_to_md(items)).encode("utf-8"))
+        for rel, data in (writer.images.items() if writer is not None else ()):
+            members[f"images/{rel}"] = self._add(f"images/{rel}", data)
+
+        self.tar.fileobj.flush()
+        entry = {"shard": self.shard_name, "members": members}
+        if self.remember_entries:
+            self.entries[pdf_name] = entry
+        self.index.write(json.dumps({"id": pdf_name, **entry}, ensure_ascii=False) + "\n")
+        self.index.flush()
+
+    def link_document(self, pdf_name, canonical):
+        # A duplicate gets an index entry pointing at the canonical copy's members; nothing is stored twice.
+        entry = self.entries.get(canonical)
+        if entry is None:
+            return False
+        self.index.write(json.dumps({"id": pdf_name, "alias_of": canonical, **entry}, ensure_ascii=False) + "\n")
+        self.index.flush()
+        return True
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+        self.index.close()
+
+
+def load_shard_index(output_folder):
+    index = {}
+    for path in sorted((Path(output_folder) / "shards").glob("index-*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                index[entry["id"]] = entry
+    return index
+
+
+def read_document(output_folder, paper_id, index=None):
+    # Random access to one paper's members: {member name: bytes}
+    index = index if index is not None else load_shard_index(output_folder)
+    entry = index[paper_id]
+    out = {}
+    with open(Path(output_folder) / "shards" / entry["shard"], "rb") as f:
+        for name, (offset, size) in entry["members"].items():
+            f.seek(offset)
+            out[name] = f.read(size)
+    return out
+
+
+def make_backend(kind, output_folder, save_raw_json=False, save_removed=False, dedup_images=False,
+                 shard_size_mb=DEFAULT_SHARD_SIZE_MB):
+    if kind == "files":
+        return FileBackend(output_folder, save_raw_json=save_raw_json, save_removed=save_removed,
+                           dedup_images=dedup_images)
+    if kind == "shards":
+        if dedup_images:
+            print("[WARN] --dedup-images only applies to the files backend; storing crops per paper in shards.")
+        return TarShardBackend(output_folder, save_removed=save_removed, shard_size_mb=shard_size_mb)
+    raise ValueError(f"Unknown output backend: {kind}")
@@ -0,0 +1,116 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import torch
+from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast
+
+from text_filters import bert_filter
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "alice", "bob", "carol", "dave", "results", "were", "good"]
+
+
+@pytest.fixture(scope="module")
+def tiny_ner(tmp_path_factory):
+    # A one-layer BERT whose classifier tags every word as B-PER, so a text has as many persons as words.
+    path = tmp_path_factory.mktemp("tiny-ner")
+    (path / "vocab.txt").write_text("\n".join(VOCAB) + "\n", encoding="utf-8")
+    BertTokenizerFast(vocab_file=str(path / "vocab.txt")).save_pretrained(path)
+    config = BertConfig(vocab_size=len(VOCAB), hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+                        intermediate_size=32, max_position_embeddings=64,
+                        id2label={0: "O", 1: "B-PER", 2: "I-PER"}, label2id={"O": 0, "B-PER": 1, "I-PER": 2})
+    model = BertForTokenClassification(config)
+    with torch.no_grad():
+        model.classifier.weight.zero_()
+        model.classifier.bias.copy_(torch.tensor([0.0, 10.0, 0.0]))
+    model.save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    bert_filter._person_cache.clear()
+    yield
+    bert_filter._person_cache.clear()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    # Texts that actually reach the model.
+    seen = []
+    build = bert_filter.get_ner_pipeline
+
+    def counting(*args, **kwargs):
+        ner = build(*args, **kwargs)
+
+        def run(texts, **kw):
+            seen.extend(texts)
+            return ner(texts, **kw)
+        return run
+
+    monkeypatch.setattr(bert_filter, "get_ner_pipeline", counting)
+    return seen
+
+
+def test_person_counts(tiny_ner):
+    assert bert_filter.person_counts(["alice bob carol", "results", "alice bob"], model=tiny_ner) == [3, 1, 2]
+
+
+def test_name_filter_many_drops_author_lists(tiny_ner):
+    docs = [
+        [{"class": "title", "content": "alice bob carol dave"},
+         {"class": "text", "content": "alice bob carol"},
+         {"class": "text", "content": "results were good"}],
+        [{"class": "list-item", "content": "alice bob carol dave"},
+         {"class": "text", "content": "results"}],
+    ]
+    (kept_a, removed_a), (kept_b, removed_b) = bert_filter.name_filter_many(docs, model=tiny_ner)
+    # "results were good" has 3 words, so it is dropped by this model as well.
+    assert [r["content"] for r in kept_a] == ["alice bob carol dave"]
+    assert [r["content"] for r in removed_a] == ["alice bob carol", "results were good"]
+    assert [r["content"] for r in kept_b] == ["results"]
+    assert [r["content"] for r in removed_b] == ["alice bob carol dave"]
+
+
+def test_cached_texts_skip_the_model(tiny_ner, calls):
+    bert_filter.person_counts(["alice bob", "results", "alice bob"], model=tiny_ner)
+    assert calls == ["alice bob", "results"]
+    assert bert_filter.person_counts(["results", "carol"], model=tiny_ner) == [1, 1]
+    assert calls == ["alice bob", "results", "carol"]
+
+
+def test_more_new_texts_than_cache_size(tiny_ner, calls, monkeypatch):
+    monkeypatch.setattr(bert_filter, "CACHE_SIZE", 2)
+    texts = ["alice", "alice bob", "alice bob carol", "bob", "results were good"]
+    assert bert_filter.person_counts(texts, model=tiny_ner) == [1, 2, 3, 1, 3]
+    assert len(bert_filter._person_cache) == 2
+    # Only the most recently used entries are kept.
+    assert bert_filter.person_counts(["bob", "results were good"], model=tiny_ner) == [1, 3]
+    assert len(calls) == 5
+
+
+def test_cache_is_per_backend_and_quantization(monkeypatch):
+    # Stub pipelines that count differently, so a cache hit across options would show up as a wrong count.
+    def fake_pipeline(model, backend="torch", quantize=False):
+        n = {("torch", False): 1, ("torch", True): 2, ("onnx", False): 3}[backend, quantize]
+        return lambda texts, **kw: [[{"entity_group": "PER"}] * n for _ in texts]
+
+    monkeypatch.setattr(bert_filter, "get_ner_pipeline", fake_pipeline)
+    assert bert_filter.person_counts(["alice"], model="m") == [1]
+    assert bert_filter.person_counts(["alice"], model="m", quantize=True) == [2]
+    assert bert_filter.person_counts(["alice"], model="m", backend="onnx") == [3]
+    assert bert_filter.person_counts(["alice"], model="m") == [1]
+
+
+def test_apply_filters_many_batches_names_across_documents(tiny_ner, monkeypatch):
+    from postprocess import apply_filters_many
+    batches = []
+    count = bert_filter.person_counts
+    monkeypatch.setattr(bert_filter, "person_counts", lambda texts, **kw: batches.append(texts) or count(texts, **kw))
+    docs = [[{"class": "text", "content": "alice bob carol"}], [{"class": "text", "content": "results"}]]
+    results = apply_filters_many(docs, {"name_filter": True, "ner_options": {"model": tiny_ner}})
+    # One call covers the candidates of both documents.
+    assert batches == [["alice bob carol", "results"]]
+    assert [[r["content"] for r in kept] for kept, _ in results] == [[], ["results"]]
+    assert [[r["content"] for r in removed["names"]] for _, removed in results] == [["alice bob carol"], []]
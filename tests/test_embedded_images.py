@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+from yolo_model.EmbeddedImages import EmbeddedImages
+
+BOX = (100, 100, 300, 200)
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 20), "red").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def page_with_image(doc, rotate=0):
+    page = doc.new_page()
+    page.insert_image(fitz.Rect(BOX), stream=png_bytes(), rotate=rotate)
+    return page
+
+
+def test_upright_placement_matches():
+    doc = fitz.open()
+    page = page_with_image(doc)
+    assert EmbeddedImages(doc).match(page, fitz.Rect(BOX)) is not None
+
+
+def test_rotated_placement_is_cropped():
+    doc = fitz.open()
+    page = page_with_image(doc, rotate=180)
+    assert EmbeddedImages(doc).match(page, fitz.Rect(BOX)) is None
+
+
+def test_mirrored_placement_is_cropped():
+    doc = fitz.open()
+    page = page_with_image(doc)
+    xref = page.get_contents()[0]
+    name = doc.xref_stream(xref).decode().split("/")[1].split()[0]
+    doc.update_stream(xref, f"q\n-200 0 0 100 300 642 cm\n/{name} Do\nQ\n".encode())
+    assert EmbeddedImages(doc).match(doc[0], fitz.Rect(BOX)) is None
+
+
+def test_rotated_page_is_cropped():
+    doc = fitz.open()
+    page = page_with_image(doc)
+    page.set_rotation(90)
+    assert EmbeddedImages(doc).match(page, fitz.Rect(page.get_image_info()[0]["bbox"])) is None
@@ -0,0 +1,82 @@
+import os, time
+
+from storage.ImageStore import ImageStore
+
+OLD = time.time() - 2 * 24 * 3600
+
+
+def age(store, key):
+    os.utime(store._object_path(key), (OLD, OLD))
+
+
+def test_gc_removes_only_old_unreferenced_objects(tmp_path):
+    store = ImageStore(tmp_path)
+    kept, dropped, fresh = store.put_bytes(b"a", "png"), store.put_bytes(b"b", "png"), store.put_bytes(b"c", "png")
+    store.commit("paper", [kept])
+    age(store, kept)
+    age(store, dropped)
+    assert store.gc() == 1
+    assert store._object_path(kept).exists()
+    assert not store._object_path(dropped).exists()
+    assert store._object_path(fresh).exists()
+
+
+def test_reused_object_survives_gc_before_commit(tmp_path):
+    # Another worker puts an object that already exists but has not committed its refs yet.
+    store = ImageStore(tmp_path)
+    key = store.put_bytes(b"a", "jpeg")
+    age(store, key)
+    assert store.put_bytes(b"a", "jpeg") == key
+    assert store.gc() == 0
+    store.commit("paper", [key])
+    assert store.gc(grace_seconds=0) == 0
+
+
+def racing_put(store, monkeypatch, on_call):
+    # Another worker puts the object and commits its refs while gc runs, at gc's `on_call`-th refs read.
+    real = store.ref_counts
+    calls = []
+
+    def ref_counts():
+        calls.append(1)
+        counts = real()
+        if len(calls) == on_call:
+            store.put_bytes(b"a", "png")
+            store.commit("other", [key_of(b"a")])
+        return counts
+
+    monkeypatch.setattr(store, "ref_counts", ref_counts)
+
+
+def key_of(data):
+    import hashlib
+    return f"{hashlib.blake2b(data, digest_size=16).hexdigest()}.png"
+
+
+def test_put_racing_gc_before_the_object_is_set_aside(tmp_path, monkeypatch):
+    store = ImageStore(tmp_path)
+    key = store.put_bytes(b"a", "png")
+    age(store, key)
+    racing_put(store, monkeypatch, on_call=1)
+    assert store.gc() == 0
+    assert store._object_path(key).read_bytes() == b"a"
+
+
+def test_put_racing_gc_after_the_object_is_set_aside(tmp_path, monkeypatch):
+    store = ImageStore(tmp_path)
+    key = store.put_bytes(b"a", "png")
+    age(store, key)
+    racing_put(store, monkeypatch, on_call=2)
+    assert store.gc() == 0
+    assert store._object_path(key).read_bytes() == b"a"
+    assert not list(store.root.glob("??/.*.gc"))
+
+
+def test_gc_leaves_temporary_files_alone(tmp_path):
+    store = ImageStore(tmp_path)
+    key = store.put_bytes(b"a", "png")
+    tmp = store._object_path(key).with_name(".partial.123.tmp")
+    tmp.write_bytes(b"x")
+    os.utime(tmp, (OLD, OLD))
+    store.gc()
+    assert tmp.exists()
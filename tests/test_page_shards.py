@@ -0,0 +1,90 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from storage.ImageWriters import MemoryImageWriter
+from yolo_model import PageShards
+
+N_PAGES = 64
+# Every fifth page places the same embedded image (a logo); the others get a cropped picture.
+LOGO_XREF = 7
+
+
+def fake_learn_banners(doc, plan):
+    return [{"text": f"banner learned from pages {plan[:3]}"}]
+
+
+def fake_get_yolo_output(pdf_name, pdf_path, output_path, image_writer=None, page_plan=None, on_event=None,
+                         cancel=None, memory=None, strip_banners=False, banners=None, embedded_links=None,
+                         embedded_images=False, **_):
+    # Names crops and reuses embedded xrefs like page_records does, one picture and one text region per page.
+    if banners is None:
+        banners = fake_learn_banners(None, page_plan) if strip_banners else []
+    links = embedded_links if embedded_links is not None else {}
+    cnt = defaultdict(int)
+    out = []
+    for pno in page_plan:
+        cnt["picture"] += 1
+        rel = f"{pdf_name}/p{pno:03d}_picture{cnt['picture']:02d}"
+        if embedded_images and pno % 5 == 0:
+            if LOGO_XREF not in links:
+                links[LOGO_XREF] = image_writer.write_bytes(f"{rel}.jpeg", b"logo")
+            content = links[LOGO_XREF]
+        else:
+            content = image_writer.write_bytes(f"{rel}.png", f"crop {pno}".encode())
+        out.append({"class": "picture", "page": pno, "content": content})
+        out.append({"class": "text", "page": pno, "content": banners[0]["text"] if banners else f"text {pno}"})
+    return out
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    doc = fitz.open()
+    for _ in range(N_PAGES):
+        doc.new_page()
+    path = tmp_path / "long.pdf"
+    doc.save(path)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def in_process(monkeypatch):
+    # Ranges run on threads of this process so the stubs apply to them.
+    monkeypatch.setattr(PageShards, "get_yolo_output", fake_get_yolo_output)
+    monkeypatch.setattr(PageShards, "learn_banners", fake_learn_banners)
+    monkeypatch.setattr(PageShards, "apply_runtime", lambda **_: None)
+    monkeypatch.setattr(PageShards, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context, initializer, initargs:
+                        ThreadPoolExecutor(max_workers, initializer=initializer, initargs=initargs))
+
+
+def run(pdf, page_workers, **options):
+    writer = MemoryImageWriter()
+    records = PageShards.get_yolo_output_sharded("long", pdf, None, image_writer=writer, page_workers=page_workers,
+                                                 split_pages=10, **options)
+    return records, writer.images
+
+
+@pytest.mark.parametrize("options", [{}, {"strip_banners": True, "embedded_images": True}])
+def test_split_run_matches_serial_run(pdf, options):
+    assert len(PageShards.split_plan(list(range(1, N_PAGES + 1)), 2)) > 1
+    serial = run(pdf, 1, **options)
+    split = run(pdf, 2, **options)
+    assert split == serial
+
+
+def test_embedded_image_written_once_across_ranges(pdf):
+    records, images = run(pdf, 2, embedded_images=True)
+    logos = {r["content"] for r in records if r["class"] == "picture" and r["page"] % 5 == 0}
+    assert logos == {"images/long/p005_picture05.jpeg"}
+    assert sum(1 for rel in images if rel.endswith(".jpeg")) == 1
+
+
+def test_banners_learned_once_from_first_pages(pdf):
+    events = []
+    records, _ = run(pdf, 2, strip_banners=True, on_event=events.append)
+    assert {r["content"] for r in records if r["class"] == "text"} == {"banner learned from pages [1, 2, 3]"}
+    assert [e["event"] for e in events].count("banners") == 1
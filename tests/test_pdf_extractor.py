@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("tqdm")
+
+import pdf_extractor
+
+
+@pytest.fixture(autouse=True)
+def no_governor(monkeypatch):
+    monkeypatch.setattr(pdf_extractor, "_governor", None)
+    monkeypatch.setattr(pdf_extractor, "_governor_options", None)
+
+
+def test_governor_is_kept_between_documents_of_a_run():
+    options = {"max_memory_mb": 4096, "trace": False}
+    first = pdf_extractor._get_governor(options, None)
+    first.batch_cap = 1
+    assert pdf_extractor._get_governor(dict(options), None) is first
+
+
+def test_governor_is_rebuilt_for_other_options():
+    first = pdf_extractor._get_governor({"max_memory_mb": 4096, "trace": False}, None)
+    first.batch_cap = 1
+    second = pdf_extractor._get_governor({"max_memory_mb": 8192, "trace": False}, None)
+    assert second is not first
+    assert second.max_bytes == 8192 * 1024 * 1024
+    assert second.batch_cap is None
+
+
+def test_no_governor_without_budget_or_trace():
+    assert pdf_extractor._get_governor({"max_memory_mb": None, "trace": False}, None) is None
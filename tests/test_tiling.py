@@ -0,0 +1,49 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from yolo_model.Tiling import merge_tile_seams, to_page
+
+# A tall page cut into a top and a bottom tile that overlap between y=800 and y=1000 (render scale 1).
+PAGE = fitz.Rect(0, 0, 600, 1800)
+TOP, BOTTOM = fitz.Rect(0, 0, 600, 1000), fitz.Rect(0, 800, 600, 1800)
+
+
+def reg(c, x0, y0, x1, y1):
+    return {"c": c, "p": 0.9, "x0": x0, "y0": y0, "x1": x1, "y1": y1}
+
+
+def boxes(regs):
+    return sorted((r["c"], r["x0"], r["y0"], r["x1"], r["y1"]) for r in regs)
+
+
+def test_cut_region_is_joined_across_the_seam():
+    top = to_page([reg(0, 50, 900, 550, 1000)], TOP, PAGE, 1.0, 0)
+    bottom = to_page([reg(0, 52, 100, 548, 400)], BOTTOM, PAGE, 1.0, 1)
+    assert boxes(merge_tile_seams(top + bottom)) == [(0, 50, 900, 550, 1200)]
+
+
+def test_neighbouring_blocks_in_the_overlap_band_stay_apart():
+    # Paragraph A lies wholly in the overlap band, paragraph B starts just below it (their boxes touch by
+    # 10 px) and runs past the top tile's bottom edge.
+    top = to_page([reg(0, 50, 820, 550, 940), reg(0, 50, 930, 550, 1000)], TOP, PAGE, 1.0, 0)
+    bottom = to_page([reg(0, 50, 20, 550, 140), reg(0, 50, 130, 550, 300)], BOTTOM, PAGE, 1.0, 1)
+    # Only B's pieces are joined; both copies of A are left for merge_overlapping_same_class.
+    assert boxes(merge_tile_seams(top + bottom)) == [(0, 50, 820, 550, 940), (0, 50, 820, 550, 940),
+                                                     (0, 50, 930, 550, 1100)]
+
+
+def test_neighbouring_column_is_not_joined():
+    # The left column is cut by the seam; the right column crosses it but only touches the left one.
+    top = to_page([reg(0, 20, 900, 300, 1000)], TOP, PAGE, 1.0, 0)
+    bottom = to_page([reg(0, 290, 50, 580, 300)], BOTTOM, PAGE, 1.0, 1)
+    assert len(merge_tile_seams(top + bottom)) == 2
+
+
+def test_region_over_three_tiles():
+    tiles = [fitz.Rect(0, 0, 600, 1000), fitz.Rect(0, 800, 600, 1800), fitz.Rect(0, 1600, 600, 2600)]
+    page = fitz.Rect(0, 0, 600, 2600)
+    regs = (to_page([reg(0, 50, 900, 550, 1000)], tiles[0], page, 1.0, 0)
+            + to_page([reg(0, 50, 100, 550, 1000)], tiles[1], page, 1.0, 1)
+            + to_page([reg(0, 50, 0, 550, 400)], tiles[2], page, 1.0, 2))
+    assert boxes(merge_tile_seams(regs)) == [(0, 50, 900, 550, 2000)]
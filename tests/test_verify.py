@@ -0,0 +1,48 @@
+import json
+
+from verify import compare_outputs, compare_regions
+
+RECORDS = [
+    {"class": "title", "x0": 10.0, "y0": 10.0, "x1": 400.0, "y1": 40.0, "content": "A trial"},
+    {"class": "section-header", "content": "Abstract"},
+    {"class": "text", "x0": 10.0, "y0": 50.0, "x1": 400.0, "y1": 300.0, "content": "We randomised 120 patients."},
+    {"class": "list-item", "content": "- first\n- second"},
+]
+
+
+def write_run(root, doc, records, markdown):
+    (root / "outputs").mkdir(parents=True)
+    (root / "raw_outputs").mkdir()
+    (root / "outputs" / f"{doc}.md").write_text(markdown, encoding="utf-8")
+    with open(root / "raw_outputs" / f"{doc}.jsonl", "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+
+def test_identical_records_agree():
+    res = compare_regions(RECORDS, [dict(r) for r in RECORDS])
+    assert res["agreement"] == 1.0
+    assert res["box_diffs"] == res["text_diffs"] == res["unmatched"] == 0
+
+
+def test_box_only_on_one_side_differs():
+    cand = [dict(r) for r in RECORDS]
+    cand[1].update(x0=0.0, y0=0.0, x1=50.0, y1=20.0)
+    assert compare_regions(RECORDS, cand)["box_diffs"] == 1
+
+
+def test_moved_box_differs():
+    cand = [dict(r) for r in RECORDS]
+    cand[2]["y0"] = 250.0
+    res = compare_regions(RECORDS, cand)
+    assert res["box_diffs"] == 1
+    assert res["agreement"] == 0.75
+
+
+def test_self_comparison_has_no_divergence(tmp_path):
+    md = "# A trial\n\n## Abstract\n\nWe randomised 120 patients.\n\n- first\n- second\n"
+    write_run(tmp_path / "baseline", "paper", RECORDS, md)
+    write_run(tmp_path / "candidate", "paper", RECORDS, md)
+    docs = compare_outputs(tmp_path / "baseline", tmp_path / "candidate", tmp_path / "diffs")
+    assert [d["divergence"] for d in docs] == [0.0]
+    assert not (tmp_path / "diffs").exists()
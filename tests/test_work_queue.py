@@ -0,0 +1,39 @@
+import os
+import sqlite3
+import time
+
+from work_queue import WorkQueue
+
+
+def test_enqueue_stores_absolute_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    queue = WorkQueue(tmp_path / "queue.db")
+    queue.enqueue([("a", "pdfs/a.pdf")])
+    assert queue.lease()["src"] == os.path.join(str(tmp_path.resolve()), "pdfs", "a.pdf")
+    queue.close()
+
+
+def test_heartbeat_survives_a_failed_renewal(tmp_path, capsys):
+    queue = WorkQueue(tmp_path / "queue.db", lease_timeout=60)
+    queue.enqueue([("a", tmp_path / "a.pdf")])
+    job = queue.lease()
+    renew, beats = queue.renew, []
+
+    def flaky(doc_id, conn=None):
+        beats.append(doc_id)
+        if len(beats) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        renew(doc_id, conn=conn)
+
+    queue.renew = flaky
+    before = queue.conn.execute("SELECT lease_until FROM jobs WHERE doc_id='a'").fetchone()[0]
+    queue.start_heartbeat(interval=0.05)
+    deadline = time.time() + 5
+    while len(beats) < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    queue.close()
+
+    assert len(beats) >= 3 and job["doc_id"] == "a"
+    assert "[WARN] could not renew the lease on a" in capsys.readouterr().out
+    with sqlite3.connect(tmp_path / "queue.db") as conn:
+        assert conn.execute("SELECT lease_until FROM jobs WHERE doc_id='a'").fetchone()[0] > before
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+pytest.importorskip("ultralytics")
+
+import torch
+from safetensors.torch import save_file
+
+from weights_utils import weights_digest
+from yolo_model import YoloModel
+from yolo_model.YoloWeights import converted_from, read_metadata
+
+
+@pytest.fixture
+def weights(tmp_path):
+    # A stand-in checkpoint and a "converted" file recording its digest, as convert_to_safetensors does.
+    pt = tmp_path / "model.pt"
+    pt.write_bytes(b"checkpoint v1")
+    st = tmp_path / "model.safetensors"
+    save_file({"w": torch.zeros(2)}, str(st), metadata={"source_sha256": weights_digest(pt)})
+    return pt, st
+
+
+@pytest.fixture
+def loaders(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(YoloModel, "YOLO", lambda path: loaded.append(("pt", str(path))) or "pt model")
+    monkeypatch.setattr("yolo_model.YoloWeights.load_mmap_model",
+                        lambda path: loaded.append(("mapped", str(path))) or "mapped model")
+    return loaded
+
+
+def test_metadata_records_the_source(weights):
+    pt, st = weights
+    assert read_metadata(st)["source_sha256"] == weights_digest(pt)
+    assert converted_from(st, pt)
+
+
+def test_matching_conversion_is_mapped(weights, loaders):
+    pt, st = weights
+    assert YoloModel._load_model(str(pt), False, "fp32", False) == "mapped model"
+    assert loaders == [("mapped", str(st))]
+
+
+def test_stale_conversion_falls_back_to_the_checkpoint(weights, loaders, capsys):
+    pt, st = weights
+    pt.write_bytes(b"checkpoint v2, re-downloaded")
+    assert not converted_from(st, pt)
+    assert YoloModel._load_model(str(pt), False, "fp32", False) == "pt model"
+    assert loaders == [("pt", str(pt))]
+    assert "[WARN]" in capsys.readouterr().out
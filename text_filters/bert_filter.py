@@ -1,24 +1,114 @@
-import torch
-from transformers import pipeline
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
 
-ner_pipeline = pipeline("token-classification", model="dslim/bert-base-NER", aggregation_strategy="simple")
+DEFAULT_NER_MODEL = "dslim/bert-base-NER"
+# Author lists only ever show up as running text or list items.
+CANDIDATE_CLASSES = {"text", "list-item"}
+PREFIX_CHARS = 60
+MIN_PERSONS = 3
+BATCH_SIZE = 32
+CACHE_SIZE = 200_000
+ONNX_CACHE_DIR = Path.home() / ".cache" / "paper_reader" / "onnx"
 
+_pipelines = {}
+_person_cache = OrderedDict()
 
-def name_filter(jsonl_data):
-    new_jsonl_data = []
-    removed = []
 
-    for json_data in jsonl_data:
-        line = json_data["content"].strip()
-        t = json_data["class"].lower()
+def _build_onnx_model(model, quantize):
+    from optimum.onnxruntime import ORTModelForTokenClassification
 
-        beg = line.strip()[:60]
-        pers = [p['word'] for p in ner_pipeline(beg) if p["entity_group"] == "PER"]
+    out_dir = ONNX_CACHE_DIR / model.replace("/", "__")
+    if not (out_dir / "model.onnx").exists():
+        ORTModelForTokenClassification.from_pretrained(model, export=True).save_pretrained(out_dir)
+    if not quantize:
+        return ORTModelForTokenClassification.from_pretrained(out_dir)
 
-        if len(pers) >= 3:
-            removed.append(json_data)
-            continue
+    if not (out_dir / "model_quantized.onnx").exists():
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(out_dir).quantize(save_dir=out_dir, quantization_config=qconfig)
+    return ORTModelForTokenClassification.from_pretrained(out_dir, file_name="model_quantized.onnx")
 
-        new_jsonl_data.append(json_data)
 
-    return new_jsonl_data, removed
+def get_ner_pipeline(model=DEFAULT_NER_MODEL, backend="torch", quantize=False):
+    # Built on first use only; `model` may be a hub id or a local directory (e.g. a tiny test model).
+    key = (model, backend, quantize)
+    if key in _pipelines:
+        return _pipelines[key]
+
+    from transformers import AutoTokenizer, pipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    if backend == "onnx":
+        ner_model = _build_onnx_model(model, quantize)
+    elif backend == "torch":
+        import torch
+        from transformers import AutoModelForTokenClassification
+        ner_model = AutoModelForTokenClassification.from_pretrained(model).eval()
+        if quantize:
+            ner_model = torch.quantization.quantize_dynamic(ner_model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        raise ValueError(f"Unknown NER backend: {backend}")
+
+    _pipelines[key] = pipeline("token-classification", model=ner_model, tokenizer=tokenizer,
+                               aggregation_strategy="simple", device=-1)
+    return _pipelines[key]
+
+
+def _snippet(json_data):
+    return (json_data.get("content") or "").strip()[:PREFIX_CHARS]
+
+
+def _is_candidate(json_data):
+    return (json_data.get("class") or "").lower() in CANDIDATE_CLASSES and bool(_snippet(json_data))
+
+
+def _cache_key(model, backend, quantize, text):
+    # The backend and quantization change the model's output, so they are part of the key.
+    return hashlib.blake2b(f"{model}\0{backend}\0{int(bool(quantize))}\0{text}".encode("utf-8"),
+                           digest_size=16).digest()
+
+
+def person_counts(texts, model=DEFAULT_NER_MODEL, backend="torch", quantize=False, batch_size=BATCH_SIZE):
+    # Number of PER entities per text; uncached texts go through the model in one batched call.
+    # Counts are collected locally first, so evicting cache entries can't lose ones this call still needs.
+    keys = [_cache_key(model, backend, quantize, t) for t in texts]
+    found = {k: _person_cache[k] for k in keys if k in _person_cache}
+    todo = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+    if todo:
+        ner = get_ner_pipeline(model, backend=backend, quantize=quantize)
+        for text, ents in zip(todo, ner(todo, batch_size=batch_size)):
+            found[_cache_key(model, backend, quantize, text)] = sum(1 for p in ents if p["entity_group"] == "PER")
+
+    for k, n in found.items():
+        _person_cache[k] = n
+        _person_cache.move_to_end(k)
+    while len(_person_cache) > CACHE_SIZE:
+        _person_cache.popitem(last=False)
+    return [found[k] for k in keys]
+
+
+def name_filter_many(docs, model=DEFAULT_NER_MODEL, backend="torch", quantize=False, batch_size=BATCH_SIZE):
+    # docs: list of jsonl_data lists; all candidate records across documents share one inference call.
+    candidates = [(d, i) for d, jsonl_data in enumerate(docs) for i, r in enumerate(jsonl_data) if _is_candidate(r)]
+    counts = person_counts([_snippet(docs[d][i]) for d, i in candidates],
+                           model=model, backend=backend, quantize=quantize, batch_size=batch_size)
+    drop = {pos for pos, n in zip(candidates, counts) if n >= MIN_PERSONS}
+
+    results = []
+    for d, jsonl_data in enumerate(docs):
+        new_jsonl_data = []
+        removed = []
+        for i, json_data in enumerate(jsonl_data):
+            if (d, i) in drop:
+                removed.append(json_data)
+                continue
+            new_jsonl_data.append(json_data)
+        results.append((new_jsonl_data, removed))
+    return results
+
+
+def name_filter(jsonl_data, **ner_options):
+    return name_filter_many([jsonl_data], **ner_options)[0]
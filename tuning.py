@@ -0,0 +1,80 @@
+import json, os, platform
+from pathlib import Path
+
+DEFAULT_PROFILE = os.environ.get("PAPER_READER_PROFILE", "tuning_profile.json")
+
+# Values used when neither the command line nor a profile sets them.
+DEFAULT_SETTINGS = {
+    "workers": 1,
+    "torch_threads": None,   # None: leave torch's own default
+    "batch_size": 1,
+    "render_scale": 3.0,
+    "pin_cpus": False,
+}
+
+
+def machine_fingerprint():
+    return {"cpu_count": os.cpu_count(), "machine": platform.machine(), "processor": platform.processor()}
+
+
+def load_profile(path=DEFAULT_PROFILE, quiet=False):
+    # Returns the tuned settings for this machine, or {} if there is no (matching) profile.
+    p = Path(path)
+    if not p.exists():
+        return {}
+    try:
+        data = json.loads(p.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Ignoring unreadable tuning profile {p}: {e}")
+        return {}
+    if data.get("machine", {}).get("cpu_count") != os.cpu_count():
+        if not quiet:
+            print(f"[WARN] Tuning profile {p} was made on a different machine; ignoring it.")
+        return {}
+    settings = {k: v for k, v in data.get("settings", {}).items() if k in DEFAULT_SETTINGS}
+    if not quiet:
+        print(f"[INFO] Using tuning profile {p}: {settings}")
+    return settings
+
+
+def save_profile(settings, path=DEFAULT_PROFILE, **extra):
+    data = {"machine": machine_fingerprint(), "settings": settings, **extra}
+    Path(path).write_text(json.dumps(data, indent=2), encoding="utf-8")
+    return str(path)
+
+
+def resolve_settings(overrides=None, profile=None):
+    # Precedence: explicit overrides (non-None) > profile > DEFAULT_SETTINGS
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(profile or {})
+    settings.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return settings
+
+
+def cpu_sets(workers, torch_threads=None):
+    # Disjoint core sets, one per worker, from the cores this process may use.
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    per = max(1, torch_threads or len(cpus) // max(1, workers))
+    return [cpus[(i * per) % len(cpus):(i * per) % len(cpus) + per] or cpus for i in range(workers)]
+
+
+def apply_runtime(torch_threads=None, cpus=None):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    if torch_threads:
+        import torch
+        torch.set_num_threads(int(torch_threads))
+
+
+def recorded_pages_per_sec(path=DEFAULT_PROFILE):
+    # Throughput autotune measured for the saved settings on this machine, or None.
+    p = Path(path)
+    if not p.exists():
+        return None
+    try:
+        data = json.loads(p.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if data.get("machine", {}).get("cpu_count") != os.cpu_count():
+        return None
+    return data.get("pages_per_sec")
@@ -0,0 +1,160 @@
+# verify.py
+import argparse, difflib, json, shutil, time
+from pathlib import Path
+
+from pdf_extractor import export_pdfs_to_mds, read_jsonl
+from progress import ThroughputTracker
+from weights_utils import ensure_yolo_weights
+from yolo_model.YoloModel import _iou
+
+
+def load_config(spec):
+    # A JSON object inline ('{"batch_size": 4}') or a path to a JSON file; keys are export_pdfs_to_mds options.
+    if not spec:
+        return {}
+    path = Path(spec)
+    text = path.read_text(encoding="utf-8") if path.is_file() else spec
+    cfg = json.loads(text)
+    if not isinstance(cfg, dict):
+        raise ValueError(f"Config must be a JSON object: {spec}")
+    return cfg
+
+
+def run_config(input_folder, output_folder, cfg):
+    # Both sides always write the file layout with raw region JSONL so they can be compared.
+    cfg = {**cfg, "output_backend": "files", "save_raw_json": True, "clean_output": True, "queue_path": None}
+    tracker = ThroughputTracker()
+    t0 = time.perf_counter()
+    skipped = export_pdfs_to_mds(input_folder, str(output_folder), on_event=tracker, **cfg)
+    return {"seconds": time.perf_counter() - t0, "pages": tracker.pages_done, "failed": skipped}
+
+
+def _box(r):
+    # None for records without coordinates (e.g. the "Abstract" header of the filters, grouped list items).
+    if all(r.get(k) is None for k in ("x0", "y0", "x1", "y1")):
+        return None
+    return r.get("x0", 0.0), r.get("y0", 0.0), r.get("x1", 0.0), r.get("y1", 0.0)
+
+
+def _box_differs(a, b, iou_t):
+    ba, bb = _box(a), _box(b)
+    if ba is None or bb is None:
+        return ba is not bb
+    return ba != bb and _iou(ba, bb) < iou_t
+
+
+def compare_regions(base, cand, iou_t=0.90, text_t=0.98):
+    # Aligns the two record sequences by class (records carry no page number after post-processing),
+    # then checks box IoU and text similarity of every aligned pair.
+    sm = difflib.SequenceMatcher(None, [r.get("class") for r in base], [r.get("class") for r in cand],
+                                 autojunk=False)
+    pairs = box_diffs = text_diffs = bad = 0
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag != "equal":
+            continue
+        for a, b in zip(base[i1:i2], cand[j1:j2]):
+            pairs += 1
+            box_bad = _box_differs(a, b, iou_t)
+            ta, tb = a.get("content") or "", b.get("content") or ""
+            text_bad = ta != tb and difflib.SequenceMatcher(None, ta, tb, autojunk=False).ratio() < text_t
+            box_diffs += box_bad
+            text_diffs += text_bad
+            bad += box_bad or text_bad
+    unmatched = len(base) + len(cand) - 2 * pairs
+    return {
+        "regions": [len(base), len(cand)],
+        "unmatched": unmatched,
+        "box_diffs": box_diffs,
+        "text_diffs": text_diffs,
+        "agreement": (pairs - bad) / max(len(base), len(cand), 1),
+    }
+
+
+def compare_markdown(base, cand):
+    a, b = base.splitlines(keepends=True), cand.splitlines(keepends=True)
+    if a == b:
+        return 1.0, []
+    ratio = difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+    return ratio, list(difflib.unified_diff(a, b, fromfile="baseline", tofile="candidate"))
+
+
+def compare_outputs(base_dir, cand_dir, diff_dir, iou_t=0.90, text_t=0.98):
+    base_md = {p.stem: p for p in (Path(base_dir) / "outputs").glob("*.md")}
+    cand_md = {p.stem: p for p in (Path(cand_dir) / "outputs").glob("*.md")}
+    docs = []
+    for doc in sorted(set(base_md) | set(cand_md)):
+        if doc not in base_md or doc not in cand_md:
+            docs.append({"doc": doc, "divergence": 1.0,
+                         "missing": "candidate" if doc in base_md else "baseline"})
+            continue
+        regions = compare_regions(list(read_jsonl(Path(base_dir) / "raw_outputs" / f"{doc}.jsonl")),
+                                  list(read_jsonl(Path(cand_dir) / "raw_outputs" / f"{doc}.jsonl")),
+                                  iou_t=iou_t, text_t=text_t)
+        md_ratio, diff = compare_markdown(base_md[doc].read_text(encoding="utf-8"),
+                                          cand_md[doc].read_text(encoding="utf-8"))
+        if diff:
+            Path(diff_dir).mkdir(parents=True, exist_ok=True)
+            (Path(diff_dir) / f"{doc}.diff").write_text("".join(diff), encoding="utf-8")
+        docs.append({"doc": doc, "divergence": round(1.0 - min(regions["agreement"], md_ratio), 6),
+                     "markdown_ratio": round(md_ratio, 6), **regions})
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a corpus through a baseline and a candidate configuration "
+                                                 "and check that the outputs match")
+    parser.add_argument("input_folder", help="Folder with PDFs to verify on")
+    parser.add_argument("--baseline", default="{}", help="Baseline options: JSON object or path to a JSON file.")
+    parser.add_argument("--candidate", required=True, help="Candidate options: JSON object or path to a JSON file.")
+    parser.add_argument("--work-dir", default="verify_runs", help="Where both runs, the diffs and report.json go.")
+    parser.add_argument("--iou", type=float, default=0.90, help="Minimum IoU for two aligned regions to match.")
+    parser.add_argument("--text-similarity", type=float, default=0.98,
+                        help="Minimum text similarity for two aligned regions to match.")
+    parser.add_argument("--doc-tolerance", type=float, default=0.0,
+                        help="A document diverges when its divergence (1 - agreement) is above this.")
+    parser.add_argument("--max-diverged", type=float, default=0.0,
+                        help="Exit non-zero when more than this fraction of documents diverge.")
+    parser.add_argument("--weights", default="yolo_model/doclaynet.pt")
+    args = parser.parse_args()
+
+    ensure_yolo_weights(weights_path=args.weights)
+    baseline, candidate = load_config(args.baseline), load_config(args.candidate)
+    # Either side may name its own "weights_path" (e.g. to compare a smaller model against the default).
+    baseline.setdefault("weights_path", args.weights)
+    candidate.setdefault("weights_path", args.weights)
+    work = Path(args.work_dir)
+
+    print(f"[INFO] baseline: {baseline}")
+    base_run = run_config(args.input_folder, work / "baseline", baseline)
+    print(f"[INFO] candidate: {candidate}")
+    cand_run = run_config(args.input_folder, work / "candidate", candidate)
+
+    shutil.rmtree(work / "diffs", ignore_errors=True)
+    docs = compare_outputs(work / "baseline", work / "candidate", work / "diffs",
+                           iou_t=args.iou, text_t=args.text_similarity)
+    diverged = [d for d in docs if d["divergence"] > args.doc_tolerance]
+    for d in diverged:
+        detail = f"missing in {d['missing']}" if "missing" in d else (
+            f"regions {d['regions'][0]}→{d['regions'][1]}, unmatched {d['unmatched']}, "
+            f"box {d['box_diffs']}, text {d['text_diffs']}, markdown {d['markdown_ratio']:.4f}")
+        print(f"[diff] {d['doc']}: divergence {d['divergence']:.4f} ({detail})")
+
+    speedup = base_run["seconds"] / cand_run["seconds"] if cand_run["seconds"] > 0 else None
+    frac = len(diverged) / max(len(docs), 1)
+    report = {"baseline": {"options": baseline, **base_run}, "candidate": {"options": candidate, **cand_run},
+              "speedup": speedup, "documents": len(docs), "diverged": len(diverged),
+              "diverged_fraction": frac, "docs": docs}
+    (work / "report.json").write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    speed_txt = f"{speedup:.2f}x" if speedup is not None else "n/a"
+    print(f"[INFO] {len(diverged)}/{len(docs)} documents diverge ({frac:.1%}); "
+          f"baseline {base_run['seconds']:.1f}s, candidate {cand_run['seconds']:.1f}s → speedup {speed_txt}")
+    print(f"[INFO] report: {work / 'report.json'}")
+    if frac > args.max_diverged:
+        print(f"❌ divergence above threshold ({frac:.1%} > {args.max_diverged:.1%})")
+        raise SystemExit(1)
+    print("✅ candidate matches baseline")
+
+
+if __name__ == "__main__":
+    main()
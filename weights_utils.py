@@ -1,4 +1,4 @@
-import shutil, subprocess
+import hashlib, json, shutil, subprocess
 from pathlib import Path
 
 def _has_cmd(name):
@@ -9,8 +9,11 @@ def ensure_yolo_weights(weights_path= "yolo_model/doclaynet.pt", repo_id= "malay
     wp = Path(weights_path)
     wp.parent.mkdir(parents=True, exist_ok=True)
     if wp.exists():
-        print(f"[INFO] Using existing weights: {wp}")
+        digest = weights_digest(wp, strict=wp.suffix == ".safetensors")
+        print(f"[INFO] Using existing weights: {wp} (sha256 {digest[:12]})")
         return str(wp)
+    if wp.suffix == ".safetensors":
+        raise FileNotFoundError(f"{wp} not found; create it with: python -m yolo_model.YoloWeights <weights.pt> {wp}")
 
     print(f"[INFO] Weights missing → {wp}. Trying auto-download...")
     if prefer_cli and _has_cmd("huggingface-cli"):
@@ -29,6 +32,7 @@ def ensure_yolo_weights(weights_path= "yolo_model/doclaynet.pt", repo_id= "malay
                 raise FileNotFoundError(f"Downloaded file not found at {src}")
             shutil.move(str(src), str(wp))
             shutil.rmtree(tmp, ignore_errors=True)
+            record_digest(wp)
             print(f"[INFO] Downloaded → {wp}")
             return str(wp)
         except Exception as e:
@@ -43,6 +47,7 @@ def ensure_yolo_weights(weights_path= "yolo_model/doclaynet.pt", repo_id= "malay
         )
         if Path(downloaded) != wp:
             shutil.move(downloaded, str(wp))
+        record_digest(wp)
         print(f"[INFO] Downloaded → {wp}")
         return str(wp)
     except Exception as e:
@@ -50,3 +55,54 @@ def ensure_yolo_weights(weights_path= "yolo_model/doclaynet.pt", repo_id= "malay
             "Failed to download weights via both CLI and Python API. "
             "Check internet and repo/filename."
         ) from e
+
+
+def _sidecar(path):
+    return Path(str(path) + ".sha256")
+
+
+def _sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def weights_digest(path, strict=False):
+    """
+    SHA-256 of a weights file, cached in a `<file>.sha256` sidecar together
+    with the file's size and mtime; the file is only hashed again when those
+    change. If it changed and the new hash differs from the recorded one, a
+    warning is printed, or with `strict` a RuntimeError is raised (used for
+    converted weights, which should never change after conversion).
+    """
+    p = Path(path)
+    st = p.stat()
+    side = _sidecar(p)
+    recorded = None
+    if side.exists():
+        try:
+            recorded = json.loads(side.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            recorded = None
+    if recorded and recorded.get("size") == st.st_size and recorded.get("mtime_ns") == st.st_mtime_ns:
+        return recorded["sha256"]
+
+    digest = _sha256(p)
+    if recorded and recorded.get("sha256") != digest:
+        msg = f"{p} does not match its recorded hash ({recorded.get('sha256', '')[:12]}… → {digest[:12]}…)"
+        if strict:
+            raise RuntimeError(msg)
+        print(f"[WARN] {msg}; recording the new hash.")
+    record_digest(p, digest)
+    return digest
+
+
+def record_digest(path, digest=None):
+    p = Path(path)
+    st = p.stat()
+    digest = digest or _sha256(p)
+    _sidecar(p).write_text(json.dumps({"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}),
+                           encoding="utf-8")
+    return digest
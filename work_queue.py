@@ -0,0 +1,178 @@
+import os, socket, sqlite3, threading, time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    doc_id      TEXT PRIMARY KEY,
+    src         TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',   -- pending | leased | done | failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    error       TEXT,
+    updated     REAL,
+    cost        REAL NOT NULL DEFAULT 0        -- larger jobs are leased first (LPT)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_until);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    SQLite-backed job table that many worker processes (on one or many hosts
+    sharing the file) lease PDFs from.
+
+    A lease is valid for `lease_timeout` seconds; a job whose worker died is
+    handed out again once its lease expires. Each hand-out counts as an attempt
+    and a job is marked failed after `max_retries` attempts. Every state change
+    runs in a BEGIN IMMEDIATE transaction, so two workers never lease the same
+    job. While a worker runs, `start_heartbeat()` keeps renewing the leases it
+    holds, so a long document is not handed to a second worker.
+    """
+
+    def __init__(self, db_path, lease_timeout=3600, max_retries=3, worker_id=None):
+        self.db_path = str(db_path)
+        self.lease_timeout = lease_timeout
+        self.max_retries = max_retries
+        self.worker_id = worker_id or default_worker_id()
+        self.conn = sqlite3.connect(self.db_path, timeout=120, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "cost" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN cost REAL NOT NULL DEFAULT 0")
+        self.held = set()
+        self._held_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def close(self):
+        self.stop_heartbeat()
+        self.conn.close()
+
+    def _hold(self, doc_id, held=True):
+        with self._held_lock:
+            (self.held.add if held else self.held.discard)(doc_id)
+
+    def start_heartbeat(self, interval=None):
+        # Renews every held lease each `interval` seconds (default: a quarter of the lease) from a
+        # background thread with its own connection, until stop_heartbeat() or close(). A failed renewal
+        # (e.g. the database stayed locked) is logged and retried on the next beat instead of ending the thread.
+        if self._heartbeat is not None:
+            return
+        interval = interval or max(1.0, self.lease_timeout / 4)
+        self._stop.clear()
+
+        def beat():
+            conn = sqlite3.connect(self.db_path, timeout=120, isolation_level=None)
+            try:
+                while not self._stop.wait(interval):
+                    with self._held_lock:
+                        held = list(self.held)
+                    for doc_id in held:
+                        try:
+                            self.renew(doc_id, conn=conn)
+                        except Exception as e:
+                            print(f"[WARN] could not renew the lease on {doc_id}: {type(e).__name__}: {e}")
+            finally:
+                conn.close()
+
+        self._heartbeat = threading.Thread(target=beat, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat is not None:
+            self._stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _tx(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def enqueue(self, items):
+        # items: iterable of (doc_id, src_path) or (doc_id, src_path, cost); already known ids are left untouched.
+        # Paths are stored absolute, so workers started from another directory find the files.
+        now = time.time()
+        added = 0
+        self._tx()
+        try:
+            for doc_id, src, *cost in items:
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO jobs (doc_id, src, updated, cost) VALUES (?, ?, ?, ?)",
+                    (doc_id, str(Path(src).resolve()), now, cost[0] if cost else 0.0))
+                added += cur.rowcount
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self):
+        now = time.time()
+        self._tx()
+        try:
+            # Expired leases that already used up their attempts are not retried.
+            self.conn.execute(
+                "UPDATE jobs SET status='failed', error=COALESCE(error, 'lease expired'), updated=? "
+                "WHERE status='leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_retries))
+            row = self.conn.execute(
+                "SELECT doc_id, src, attempts FROM jobs "
+                "WHERE status='pending' OR (status='leased' AND lease_until < ?) "
+                "ORDER BY attempts, cost DESC, doc_id LIMIT 1",
+                (now,)).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE jobs SET status='leased', worker=?, lease_until=?, attempts=attempts+1, updated=? "
+                    "WHERE doc_id=?",
+                    (self.worker_id, now + self.lease_timeout, now, row[0]))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        self._hold(row[0])
+        return {"doc_id": row[0], "src": row[1], "attempt": row[2] + 1}
+
+    def renew(self, doc_id, conn=None):
+        (conn or self.conn).execute(
+            "UPDATE jobs SET lease_until=?, updated=? WHERE doc_id=? AND worker=? AND status='leased'",
+            (time.time() + self.lease_timeout, time.time(), doc_id, self.worker_id))
+
+    def complete(self, doc_id):
+        self._hold(doc_id, False)
+        self.conn.execute(
+            "UPDATE jobs SET status='done', error=NULL, lease_until=NULL, updated=? WHERE doc_id=? AND worker=?",
+            (time.time(), doc_id, self.worker_id))
+
+    def release(self, doc_id):
+        # Hand an unfinished job back without counting the attempt (e.g. the run was cancelled).
+        self._hold(doc_id, False)
+        self.conn.execute(
+            "UPDATE jobs SET status='pending', attempts=MAX(0, attempts-1), lease_until=NULL, updated=? "
+            "WHERE doc_id=? AND worker=? AND status='leased'",
+            (time.time(), doc_id, self.worker_id))
+
+    def fail(self, doc_id, error):
+        self._hold(doc_id, False)
+        self.conn.execute(
+            "UPDATE jobs SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error=?, lease_until=NULL, updated=? WHERE doc_id=? AND worker=?",
+            (self.max_retries, str(error), time.time(), doc_id, self.worker_id))
+
+    def stats(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def failed(self):
+        return self.conn.execute("SELECT doc_id, src, error FROM jobs WHERE status='failed'").fetchall()
+
+    def iter_leases(self):
+        while True:
+            job = self.lease()
+            if job is None:
+                return
+            yield job
@@ -0,0 +1,81 @@
+import fitz
+
+# Formats that are written as extracted; anything else (JPX, JBIG2, CMYK JPEGs, images with a soft mask) is
+# cropped from the render instead, since browsers and Markdown viewers can't show it as is.
+NATIVE_EXTS = {"png", "jpeg", "jpg"}
+# A picture box and an image placement match when they overlap this much (IoU in page points).
+MATCH_IOU = 0.70
+
+
+def _iou(a, b):
+    inter = fitz.Rect(a) & fitz.Rect(b)
+    if inter.is_empty:
+        return 0.0
+    ia = inter.width * inter.height
+    return ia / (a.width * a.height + b.width * b.height - ia + 1e-9)
+
+
+def _upright(transform):
+    # Image matrix (a, b, c, d, e, f) that only scales and moves; PDF image space is flipped
+    # vertically, so MuPDF reports an upright placement with d > 0 after its own flip.
+    a, b, c, d = (transform or (1, 0, 0, 1))[:4]
+    return a > 0 and d > 0 and b == 0 and c == 0
+
+
+class EmbeddedImages:
+    """
+    Picture regions of one document taken from the bitmaps embedded in the
+    PDF instead of cropped from the page render.
+
+    `match(page, rect)` looks for an image placement on the page whose bbox
+    overlaps the picture box (page points) by at least MATCH_IOU; `write()`
+    extracts that image once per xref and writes its stored bytes through
+    the image writer without decoding or re-encoding them. The same xref on
+    later pages (logos, repeated figures) links to the first copy. Returns
+    None whenever no usable native image exists, so the caller falls back
+    to the render crop (vector figures, tables, formulas, masked images).
+    """
+
+    def __init__(self, doc, links=None):
+        # links: xref → link (None: not usable), may be supplied to see which xref each link came from
+        self.doc = doc
+        self.placements = {}
+        self.links = links if links is not None else {}
+        self.matched = 0
+        self.reused = 0
+
+    def _page_images(self, page):
+        if page.number not in self.placements:
+            try:
+                infos = [] if page.rotation else page.get_image_info(xrefs=True)
+            except Exception:
+                infos = []
+            # extract_image returns the bitmap as stored: rotated, sheared or flipped placements (and every image
+            # of a rotated page) would come out in the wrong orientation, so those are cropped from the render.
+            self.placements[page.number] = [(info["xref"], fitz.Rect(info["bbox"])) for info in infos
+                                            if info.get("xref", 0) > 0 and _upright(info.get("transform"))]
+        return self.placements[page.number]
+
+    def match(self, page, rect):
+        best, best_iou = None, MATCH_IOU
+        for xref, bbox in self._page_images(page):
+            iou = _iou(rect, bbox)
+            if iou >= best_iou:
+                best, best_iou = xref, iou
+        return best
+
+    def write(self, writer, rel_stem, xref):
+        # rel_stem: relative name without extension; returns the link, or None to fall back to cropping.
+        if xref in self.links:
+            self.reused += 1
+            return self.links[xref]
+        link = None
+        try:
+            img = self.doc.extract_image(xref)
+        except Exception:
+            img = None
+        if img and img.get("ext") in NATIVE_EXTS and not img.get("smask") and img.get("colorspace", 3) in (1, 3):
+            link = writer.write_bytes(f"{rel_stem}.{img['ext']}", img["image"])
+            self.matched += 1
+        self.links[xref] = link
+        return link
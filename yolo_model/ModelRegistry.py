@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+BACKENDS = ("torch", "optimized")
+# Without a memory budget, at most this many detectors stay loaded per process.
+MAX_MODELS = 2
+
+
+def model_bytes(model):
+    # Parameters and buffers of the network; what a resident model costs beyond the shared runtime.
+    net = getattr(model, "model", model)
+    seen, total = set(), 0
+    for t in list(net.parameters()) + list(net.buffers()):
+        if t.data_ptr() in seen:
+            continue
+        seen.add(t.data_ptr())
+        total += t.numel() * t.element_size()
+    return total
+
+
+class ModelRegistry:
+    """
+    Per-process cache of loaded YOLO detectors keyed by (weights path,
+    backend, precision, compile). Several models can stay resident at once
+    (e.g. an accurate and a fast one); each is charged its parameter bytes,
+    and when loading another would exceed `max_memory_mb` (or, without a
+    budget, `max_models`) the least recently used ones are dropped first.
+    Each model gets its own predict lock, so different models can run at
+    the same time in different threads.
+    """
+
+    def __init__(self, max_memory_mb=None, max_models=MAX_MODELS):
+        self.lock = threading.Lock()
+        self.models = OrderedDict()
+        self.configure(max_memory_mb, max_models)
+
+    def configure(self, max_memory_mb=None, max_models=MAX_MODELS):
+        self.max_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+        self.max_models = max_models
+
+    @staticmethod
+    def key(weights_path, backend="torch", precision="fp32", compile_model=False):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown model backend {backend!r}, expected one of {BACKENDS}")
+        # fp32 without the optimized backend ignores precision/compile, so those all share one entry.
+        if backend == "torch":
+            precision, compile_model = "fp32", False
+        return str(Path(weights_path).resolve()), backend, precision, bool(compile_model)
+
+    def _evict(self, need):
+        while self.models:
+            used = sum(size for _, size in self.models.values())
+            over_budget = self.max_bytes is not None and used + need > self.max_bytes
+            over_count = self.max_bytes is None and self.max_models and len(self.models) >= self.max_models
+            if not (over_budget or over_count):
+                return
+            key, (_, size) = self.models.popitem(last=False)
+            print(f"[INFO] model cache: unloading {Path(key[0]).name} ({key[1]}, {key[2]}, {size / 2**20:.0f} MB)")
+
+    def get(self, weights_path, backend="torch", precision="fp32", compile_model=False, loader=None):
+        key = self.key(weights_path, backend, precision, compile_model)
+        # Loading happens under the lock, so concurrent first calls never load the same model twice.
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            # The size is only known after loading; a same-path entry is the best estimate of what's coming.
+            estimate = max((size for k, (_, size) in self.models.items() if k[0] == key[0]), default=0)
+            self._evict(estimate)
+            model = loader(key[0], backend == "optimized", key[2], key[3])
+            model.predict_lock = threading.Lock()
+            size = model_bytes(model)
+            self._evict(size)
+            self.models[key] = (model, size)
+            return model
+
+    def resident(self):
+        # [(weights path, backend, precision, MB)] from least to most recently used.
+        with self.lock:
+            return [(k[0], k[1], k[2], round(size / 2**20, 1)) for k, (_, size) in self.models.items()]
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
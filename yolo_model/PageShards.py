@@ -0,0 +1,142 @@
+import math, multiprocessing, os
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pdf_processor.PagePlanner import plan_pages
+from pdf_processor.RepeatedBanners import learn_banners
+from pdf_processor.PdfSource import open_pdf
+from progress import QueueSink, check_cancel, drain, emit
+from storage.ImageWriters import DiskImageWriter, MemoryImageWriter
+from tuning import apply_runtime
+from .YoloModel import IMAGE_CLASSES, get_yolo_output
+
+# Documents with more planned pages than this are split into page ranges when page_workers > 1.
+SPLIT_PAGES = 200
+# Ranges are never shorter than this; up to two ranges per worker let fast workers pick up the slack.
+MIN_RANGE_PAGES = 16
+
+_events = None
+_cancel = None
+
+
+def _init_shard(torch_threads, event_queue, cancel_event):
+    global _events, _cancel
+    apply_runtime(torch_threads=torch_threads)
+    _events = QueueSink(event_queue) if event_queue is not None else None
+    _cancel = cancel_event
+
+
+def _detect_range(pdf_name, pdf_path, pages, yolo_options):
+    # Own fitz handle and model (loaded once per process); crops come back encoded, the parent names and writes them.
+    # Also returns link → xref of the embedded images written, so the parent can drop repeats of earlier ranges.
+    writer = MemoryImageWriter()
+    embedded_links = {}
+    records = get_yolo_output(pdf_name, pdf_path, None, image_writer=writer, page_plan=pages, on_event=_events,
+                              cancel=_cancel, embedded_links=embedded_links, **yolo_options)
+    return records, writer.images, {link: xref for xref, link in embedded_links.items() if link}
+
+
+def split_plan(pages, workers, min_range_pages=MIN_RANGE_PAGES):
+    # Contiguous ranges of the planned pages, in page order.
+    n = max(1, min(2 * workers, len(pages) // max(1, min_range_pages)))
+    size = math.ceil(len(pages) / n)
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+
+def _shard_threads(workers):
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return max(1, cpus // workers)
+
+
+def _merge_range(pdf_name, records, images, xrefs, writer, cnt, xref_links):
+    # Renames the crops of one range as a serial run would have (per-document counters), writes them, relinks.
+    # xref_links (xref → final link) carries embedded images across ranges: an xref an earlier range already
+    # wrote links to that copy, as in a serial run.
+    links = {}
+    for r in records:
+        if r["class"] in IMAGE_CLASSES:
+            cnt[r["class"]] += 1
+            old = r["content"]
+            if old not in links:
+                xref = xrefs.get(old)
+                if xref is not None and xref in xref_links:
+                    links[old] = xref_links[xref]
+                else:
+                    rel = old[len("images/"):]
+                    ext = rel.rsplit(".", 1)[-1]
+                    new_rel = f"{pdf_name}/p{r['page']:03d}_{r['class']}{cnt[r['class']]:02d}.{ext}"
+                    links[old] = writer.write_bytes(new_rel, images[rel])
+                    if xref is not None:
+                        xref_links[xref] = links[old]
+            r["content"] = links[old]
+    return records
+
+
+def get_yolo_output_sharded(pdf_name, pdf_path, output_path, image_writer=None, page_workers=2,
+                            split_pages=SPLIT_PAGES, on_event=None, cancel=None, memory=None, max_pages=None,
+                            page_range=None, skip_references=False, stop_at_references=False, **yolo_options):
+    """
+    get_yolo_output for long documents: the planned pages are cut into
+    contiguous ranges that `page_workers` processes detect in parallel, each
+    with its own fitz handle and model. Range results are merged back in page
+    order as soon as every earlier range is in, so the records (and crop
+    names) are the same as from a serial run. Banners (strip_banners) are
+    learned once here from the document's first planned pages and given to
+    every range. Documents with at most `split_pages` planned pages run
+    serially in this process.
+    """
+    with open_pdf(pdf_path) as doc:
+        n_doc = len(doc)
+        plan = plan_pages(doc, max_pages=max_pages, page_range=page_range, skip_references=skip_references,
+                          stop_at_references=stop_at_references)
+        split = page_workers > 1 and len(plan) > split_pages
+        if split:
+            range_options = dict(yolo_options, banners=learn_banners(doc, plan)
+                                 if yolo_options.get("strip_banners") else [])
+            if range_options["banners"]:
+                emit(on_event, "banners", doc=pdf_name, banners=[b["text"][:80] for b in range_options["banners"]])
+    if len(plan) < n_doc:
+        emit(on_event, "pages_skipped", doc=pdf_name, pages=n_doc, skipped=n_doc - len(plan))
+    if not split:
+        return get_yolo_output(pdf_name, pdf_path, output_path, image_writer=image_writer, on_event=on_event,
+                               cancel=cancel, memory=memory, page_plan=plan, **yolo_options)
+
+    writer = image_writer or DiskImageWriter(output_path)
+    ranges = split_plan(plan, page_workers)
+    workers = min(page_workers, len(ranges))
+    print(f"[INFO] {pdf_name}: {len(plan)} pages in {len(ranges)} ranges on {workers} processes")
+    # spawn: forking a process that already runs torch/OpenMP threads can deadlock the child.
+    ctx = multiprocessing.get_context("spawn")
+    event_queue = ctx.Queue() if on_event is not None else None
+    # Also set when a range fails, so the other ranges stop at their next page.
+    cancel_event = ctx.Event()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_shard,
+                               initargs=(_shard_threads(workers), event_queue, cancel_event))
+    out = []
+    cnt = defaultdict(int)
+    xref_links = {}
+    try:
+        futs = [pool.submit(_detect_range, pdf_name, pdf_path, pages, range_options) for pages in ranges]
+        pending = set(futs)
+        merged = 0
+        while merged < len(futs):
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            if event_queue is not None:
+                drain(event_queue, on_event)
+            if cancel is not None and cancel.is_set():
+                cancel_event.set()
+                check_cancel(cancel)
+            for fut in done:
+                if fut.exception() is not None:
+                    raise fut.exception()
+            while merged < len(futs) and futs[merged].done():
+                records, images, xrefs = futs[merged].result()
+                out += _merge_range(pdf_name, records, images, xrefs, writer, cnt, xref_links)
+                futs[merged] = None
+                merged += 1
+    finally:
+        cancel_event.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        if event_queue is not None:
+            drain(event_queue, on_event)
+    return out
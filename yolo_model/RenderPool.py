@@ -0,0 +1,135 @@
+import gc, math, multiprocessing, os, queue
+from multiprocessing import shared_memory
+
+import fitz
+from PIL import Image
+
+from pdf_processor.PdfSource import open_pdf
+
+# Seconds between liveness checks while waiting on a queue.
+_POLL = 1.0
+
+
+def frame_bytes(rect, render_scale):
+    # Upper bound of an RGB pixmap of `rect` at `render_scale` (MuPDF rounds the pixel box outwards).
+    return (math.ceil(rect.width * render_scale) + 1) * (math.ceil(rect.height * render_scale) + 1) * 3
+
+
+def _get(q, parent_pid):
+    while True:
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            # Orphaned (the process that started us was killed, e.g. by the document watchdog): stop.
+            if os.getppid() != parent_pid:
+                return None
+
+
+def _render_main(pdf_path, shm_name, slot_bytes, tasks, free_slots, done, parent_pid):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        with open_pdf(pdf_path) as doc:
+            while True:
+                slot = _get(free_slots, parent_pid)
+                if slot is None:
+                    return
+                task = _get(tasks, parent_pid)
+                if task is None:
+                    return
+                pno, scale = task
+                try:
+                    pix = doc[pno - 1].get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+                    n = pix.width * pix.height * 3
+                    if n > slot_bytes:
+                        raise ValueError(f"frame of {n} bytes does not fit a {slot_bytes} byte slot")
+                    off = slot * slot_bytes
+                    shm.buf[off:off + n] = pix.samples_mv
+                    done.put(("ok", pno, slot, pix.width, pix.height))
+                    del pix
+                except Exception as e:
+                    free_slots.put(slot)
+                    done.put(("err", pno, f"{type(e).__name__}: {e}", 0, 0))
+    finally:
+        shm.close()
+
+
+class PageRenderPool:
+    """
+    Renders the pages of one PDF in `workers` separate processes, each with its
+    own fitz document, into a shared-memory ring of RGB frames.
+
+    The ring has `slots` frames of `slot_bytes` (the largest planned page). A
+    worker takes a free slot, then the next page from a shared FIFO queue, and
+    writes the pixmap samples straight into the slot; only (page, slot, size)
+    travels back through a queue. `frame(pno)` returns a PIL image that views
+    the slot without copying; `release(pno)` hands the slot back once the page's
+    crops have been taken. With at least workers + batch + 1 slots the page
+    being waited for always holds a slot, so pages can be consumed in order.
+    """
+
+    def __init__(self, pdf_path, pages, slot_bytes, workers=2, slots=None):
+        # pages: [(page number, render scale)] in the order they will be consumed
+        self.ctx = multiprocessing.get_context()
+        self.workers = max(1, workers)
+        n_slots = max(slots or 0, self.workers + 2)
+        self.slot_bytes = max(1, slot_bytes)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, n_slots * self.slot_bytes))
+        self.tasks = self.ctx.Queue()
+        self.free_slots = self.ctx.Queue()
+        self.done = self.ctx.Queue()
+        self.ready = {}
+        self.held = {}
+        for slot in range(n_slots):
+            self.free_slots.put(slot)
+        for pno, scale in pages:
+            self.tasks.put((pno, scale))
+        for _ in range(self.workers):
+            self.tasks.put(None)
+        self.procs = [
+            self.ctx.Process(target=_render_main, daemon=True,
+                             args=(pdf_path, self.shm.name, self.slot_bytes, self.tasks, self.free_slots,
+                                   self.done, os.getpid()))
+            for _ in range(self.workers)]
+        for p in self.procs:
+            p.start()
+
+    def _wait(self, pno):
+        while pno not in self.ready:
+            try:
+                status, got, a, w, h = self.done.get(timeout=_POLL)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.procs):
+                    raise RuntimeError(f"render workers exited before page {pno} was rendered")
+                continue
+            if status != "ok":
+                raise RuntimeError(f"rendering page {got} failed: {a}")
+            self.ready[got] = (a, w, h)
+
+    def frame(self, pno):
+        self._wait(pno)
+        slot, w, h = self.ready.pop(pno)
+        self.held[pno] = slot
+        off = slot * self.slot_bytes
+        return Image.frombuffer("RGB", (w, h), self.shm.buf[off:off + w * h * 3], "raw", "RGB", 0, 1)
+
+    def release(self, pno):
+        slot = self.held.pop(pno, None)
+        if slot is not None:
+            self.free_slots.put(slot)
+
+    def close(self):
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+        for p in self.procs:
+            p.join(5)
+        for q in (self.tasks, self.free_slots, self.done):
+            q.cancel_join_thread()
+            q.close()
+        # Frames handed out must be gone before the segment can be closed.
+        gc.collect()
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        self.shm.unlink()
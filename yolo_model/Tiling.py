@@ -0,0 +1,106 @@
+import math
+
+import fitz
+from PIL import Image
+
+# Oversized pages are cut into tiles of TILE_PTS page points (a US Letter height) overlapping by TILE_OVERLAP.
+TILE_PTS = 792.0
+TILE_OVERLAP = 0.15
+# Pixels from an inner tile edge within which a box counts as cut by the seam.
+SEAM_EPS = 4.0
+
+
+def is_oversized(page, tile_above):
+    # tile_above: longest page side in points above which a page is tiled (None/0: never)
+    return bool(tile_above) and max(page.rect.width, page.rect.height) > tile_above
+
+
+def _starts(a, b, tile, overlap):
+    if b - a <= tile:
+        return [a]
+    n = math.ceil((b - a - tile) / (tile * (1 - overlap))) + 1
+    # Spread evenly so the last tile ends on the page edge; the overlap only grows.
+    step = (b - a - tile) / (n - 1)
+    return [a + i * step for i in range(n)]
+
+
+def page_tiles(rect, tile=TILE_PTS, overlap=TILE_OVERLAP):
+    return [fitz.Rect(x, y, min(x + tile, rect.x1), min(y + tile, rect.y1))
+            for y in _starts(rect.y0, rect.y1, tile, overlap) for x in _starts(rect.x0, rect.x1, tile, overlap)]
+
+
+def render_clip(page, clip, render_scale):
+    pix = page.get_pixmap(matrix=fitz.Matrix(render_scale, render_scale), clip=clip, alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def render_crop(page, clip, render_scale, max_pixels=None):
+    # Crop of a tiled page: rendered at render_scale unless that would exceed max_pixels (default: one
+    # tile's pixels), in which case the zoom is lowered, so a poster-sized figure costs no more than a tile.
+    max_pixels = max_pixels or (TILE_PTS * render_scale) ** 2
+    area = max(clip.width * clip.height, 1e-6)
+    return render_clip(page, clip, min(render_scale, math.sqrt(max_pixels / area)))
+
+
+def to_page(regs, tile, page_rect, render_scale, tile_no):
+    # Tile pixel boxes → page pixel boxes. Each side that touches an inner tile edge (cut by a seam) is
+    # recorded in "seams" as (side, seam position in page pixels).
+    ox, oy = (tile.x0 - page_rect.x0) * render_scale, (tile.y0 - page_rect.y0) * render_scale
+    w, h = tile.width * render_scale, tile.height * render_scale
+    inner = {"x0": tile.x0 > page_rect.x0, "y0": tile.y0 > page_rect.y0,
+             "x1": tile.x1 < page_rect.x1, "y1": tile.y1 < page_rect.y1}
+    edges = {"x0": (0.0, ox), "y0": (0.0, oy), "x1": (w, ox + w), "y1": (h, oy + h)}
+    out = []
+    for r in regs:
+        seams = {(side, page_at) for side, (at, page_at) in edges.items()
+                 if inner[side] and abs(r[side] - at) <= SEAM_EPS}
+        out.append({**r, "x0": r["x0"] + ox, "y0": r["y0"] + oy, "x1": r["x1"] + ox, "y1": r["y1"] + oy,
+                    "tiles": {tile_no}, "seams": seams})
+    return out
+
+
+def _continues(piece, other):
+    # True if `other` carries `piece` on across one of its seams: it starts on piece's side of the seam line,
+    # reaches clearly past it, and the two share at least half of the shorter extent along the seam.
+    for side, at in piece["seams"]:
+        axis, across = side[0], "y" if side[0] == "x" else "x"
+        lo, hi = other[axis + "0"], other[axis + "1"]
+        crosses = lo < at < hi - SEAM_EPS if side[1] == "1" else lo + SEAM_EPS < at < hi
+        along = min(piece[across + "1"], other[across + "1"]) - max(piece[across + "0"], other[across + "0"])
+        shorter = min(piece[across + "1"] - piece[across + "0"], other[across + "1"] - other[across + "0"])
+        if crosses and along >= 0.5 * shorter > 0:
+            return True
+    return False
+
+
+def merge_tile_seams(regs):
+    """
+    Joins the pieces of a region that a tile seam cut in two: same class,
+    seen by different tiles, and one piece ends on a seam that the other
+    reaches across while lining up with it along the seam. Neighbouring
+    regions in the overlap band are therefore kept apart, and whole
+    duplicates from overlapping tiles are left to merge_overlapping_same_class,
+    which page_records runs afterwards. A joined region stays open only on
+    the seams it still ends on (a region spanning three tiles).
+    """
+    regs = list(regs)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regs)):
+            a = regs[i]
+            for j in range(i + 1, len(regs)):
+                b = regs[j]
+                if a["c"] != b["c"] or a["tiles"] & b["tiles"] or not (_continues(a, b) or _continues(b, a)):
+                    continue
+                box = {"x0": min(a["x0"], b["x0"]), "y0": min(a["y0"], b["y0"]),
+                       "x1": max(a["x1"], b["x1"]), "y1": max(a["y1"], b["y1"])}
+                seams = {(side, at) for side, at in a["seams"] | b["seams"] if abs(box[side] - at) <= SEAM_EPS}
+                regs[i] = {"c": a["c"], "p": max(a["p"], b["p"]), **box, "tiles": a["tiles"] | b["tiles"],
+                           "seams": seams}
+                del regs[j]
+                merged = True
+                break
+            if merged:
+                break
+    return [{k: v for k, v in r.items() if k not in ("tiles", "seams")} for r in regs]
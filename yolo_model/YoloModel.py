@@ -1,12 +1,29 @@
+import threading, time
+from pathlib import Path
+
 import fitz
 from ultralytics import YOLO
 from PIL import Image
 from collections import defaultdict
-from functools import lru_cache
+
+from pdf_processor.PagePlanner import plan_pages
+from pdf_processor.PdfSource import open_pdf
+from pdf_processor.RepeatedBanners import learn_banners, match_banner
+from progress import check_cancel, emit
+from .EmbeddedImages import EmbeddedImages
+from .ModelRegistry import MAX_MODELS, ModelRegistry
+from .RenderPool import PageRenderPool, frame_bytes
+from .Tiling import TILE_PTS, is_oversized, merge_tile_seams, page_tiles, render_clip, render_crop, to_page
+from storage.ImageWriters import DiskImageWriter
 
 RENDER_SCALE = 3.0
+BATCH_SIZE = 1
+# Pages whose content streams exceed this are rendered at HEAVY_RENDER_SCALE instead.
+HEAVY_PAGE_BYTES = 8 * 1024 * 1024
+HEAVY_RENDER_SCALE = 1.5
 IMAGE_CLASSES = {"picture", "table", "formula"}
 DEFAULT_WEIGHTS = "yolo_model/doclaynet.pt"
+_PREDICT_LOCK = threading.Lock()
 
 import warnings
 warnings.filterwarnings(
@@ -16,10 +33,38 @@ warnings.filterwarnings(
 )
 
 
-@lru_cache(maxsize=1)
-def get_model(weights_path: str = DEFAULT_WEIGHTS):
-    # Lazy load on first use only
-    return YOLO(weights_path)
+def _load_model(weights_path, optimize, precision, compile_model):
+    # A converted copy next to the checkpoint is preferred: it is memory-mapped and shared between worker
+    # processes instead of being unpickled into each of them (see YoloWeights.convert_to_safetensors).
+    # A copy converted from another checkpoint (the .pt was replaced or re-downloaded since) is not used.
+    mapped = Path(weights_path).with_suffix(".safetensors")
+    use_mapped = False
+    if mapped.exists():
+        from .YoloWeights import converted_from, load_mmap_model
+        use_mapped = converted_from(mapped, weights_path)
+        if not use_mapped:
+            print(f"[WARN] {mapped} was converted from another checkpoint than {weights_path}; loading the .pt "
+                  f"(re-run python -m yolo_model.YoloWeights {weights_path})")
+    model = load_mmap_model(mapped) if use_mapped else YOLO(weights_path)
+    if optimize:
+        from .YoloOptimize import optimize_model
+        # Mapped weights stay in their layout so --optimize doesn't copy them back into every process.
+        optimize_model(model, precision=precision, compile_model=compile_model, channels_last=not use_mapped)
+    return model
+
+
+MODELS = ModelRegistry()
+
+
+def configure_models(max_memory_mb=None, max_models=MAX_MODELS):
+    # Budget of this process's model cache (see ModelRegistry).
+    MODELS.configure(max_memory_mb, max_models)
+
+
+def get_model(weights_path: str = DEFAULT_WEIGHTS, optimize=False, precision="fp32", compile_model=False):
+    # Lazy load on first use; later calls with the same weights/backend/precision get the resident model.
+    backend = "optimized" if optimize else "torch"
+    return MODELS.get(weights_path or DEFAULT_WEIGHTS, backend, precision, compile_model, loader=_load_model)
 
 
 def _iou(a, b):
@@ -133,35 +178,195 @@ def sort_regions_interleaved(regs, page, render_scale=3.0, full_w=0.70, min_gap=
     return out
 
 
-def get_yolo_output(pdf_name, pdf_path, output_path):
-    model = get_model()
+def render_page(page, render_scale=RENDER_SCALE):
+    mat = fitz.Matrix(render_scale, render_scale)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def content_stream_bytes(page):
+    # Size of the page's content streams from their /Length entries, without reading or inflating them.
+    doc = page.parent
+    total = 0
+    for xref in page.get_contents():
+        kind, value = doc.xref_get_key(xref, "Length")
+        if kind == "int":
+            total += int(value)
+        else:
+            total += len(doc.xref_stream_raw(xref) or b"")
+    return total
+
+
+def page_render_scale(page, render_scale=RENDER_SCALE, heavy_page_bytes=HEAVY_PAGE_BYTES,
+                      heavy_render_scale=HEAVY_RENDER_SCALE):
+    # Pages with huge vector drawings are what make get_pixmap/get_text crawl; render those coarser.
+    if heavy_page_bytes and content_stream_bytes(page) > heavy_page_bytes:
+        return min(render_scale, heavy_render_scale)
+    return render_scale
+
+
+def predict_regions(model, ims):
+    # ultralytics predictors keep per-call state, so threads sharing a model take turns.
+    with getattr(model, "predict_lock", _PREDICT_LOCK):
+        results = model.predict(ims, conf=0.40, iou=0.10, agnostic_nms=True, verbose=False)
+    return [_results_to_regs(res) for res in results]
+
+
+def predict_tiled(model, page, render_scale=RENDER_SCALE, batch_size=BATCH_SIZE):
+    # Oversized page: overlapping tiles at the normal scale instead of one huge render; boxes come back in
+    # page pixels with the pieces cut by tile seams joined. Only `batch_size` tile images exist at a time.
+    tiles = page_tiles(page.rect)
+    regs = []
+    for i in range(0, len(tiles), batch_size):
+        chunk = tiles[i:i + batch_size]
+        ims = [render_clip(page, tile, render_scale) for tile in chunk]
+        for j, (tile, tile_regs) in enumerate(zip(chunk, predict_regions(model, ims))):
+            regs += to_page(tile_regs, tile, page.rect, render_scale, i + j)
+        del ims
+    return merge_tile_seams(regs)
+
+
+def page_records(pdf_name, pno, page, im, regs, writer, cnt, render_scale=RENDER_SCALE, out_scale=None,
+                 embedded=None, banners=None):
+    # Record boxes are reported at out_scale (default: render_scale) so a document shares one coordinate system.
+    # With `embedded` (EmbeddedImages), pictures are written from the PDF's own bitmaps when one matches.
+    # Text regions inside a learned banner (learn_banners) get the banner's text and "banner": True, unextracted.
+    # `im` is None for a tiled page (predict_tiled); its crops are then rendered region by region, each
+    # capped at a tile's pixels (render_crop).
+    k = (out_scale or render_scale) / render_scale
     out = []
-    cnt = defaultdict(int)
-    with fitz.open(pdf_path) as doc:
-        for pno, page in enumerate(doc, 1):
-            mat = fitz.Matrix(RENDER_SCALE, RENDER_SCALE)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            im = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
-            res = model.predict(im, conf=0.40, iou=0.10, agnostic_nms=True, verbose=False)[0]
-            regs = _results_to_regs(res)
-            regs = merge_overlapping_same_class(regs, page, render_scale=RENDER_SCALE, iou_t=0.40, cont_t=0.85, eps=2.0)
-            regs = sort_regions_interleaved(regs, page, render_scale=RENDER_SCALE)
-            for r in regs:
-                pad = 6.0
-                x0 = max(0, r["x0"] - pad);
-                y0 = max(0, r["y0"] - pad)
-                x1 = min(pix.width, r["x1"] + pad);
-                y1 = min(pix.height, r["y1"] + pad)
-                if r["c"] in IMAGE_CLASSES:
-                    cnt[r["c"]] += 1
-                    rel = f"{pdf_name}/p{pno:03d}_{r['c']}{cnt[r['c']]:02d}.png"
-                    Image.frombytes("RGB", (pix.width, pix.height), pix.samples).crop((x0, y0, x1, y1)).save(
-                        f"{output_path}/{rel}")
-                    content = f"images/{rel}"
+    width, height = (im.width, im.height) if im is not None else (page.rect.width * render_scale,
+                                                                   page.rect.height * render_scale)
+    regs = merge_overlapping_same_class(regs, page, render_scale=render_scale, iou_t=0.40, cont_t=0.85, eps=2.0)
+    regs = sort_regions_interleaved(regs, page, render_scale=render_scale)
+    for r in regs:
+        banner = None
+        pad = 6.0
+        x0 = max(0, r["x0"] - pad);
+        y0 = max(0, r["y0"] - pad)
+        x1 = min(width, r["x1"] + pad);
+        y1 = min(height, r["y1"] + pad)
+        if r["c"] in IMAGE_CLASSES:
+            cnt[r["c"]] += 1
+            rel = f"{pdf_name}/p{pno:03d}_{r['c']}{cnt[r['c']]:02d}"
+            content = None
+            if embedded is not None and r["c"] == "picture":
+                box = fitz.Rect(r["x0"], r["y0"], r["x1"], r["y1"]) / render_scale
+                xref = embedded.match(page, box)
+                if xref:
+                    content = embedded.write(writer, rel, xref)
+            if content is None:
+                if im is not None:
+                    crop = im.crop((x0, y0, x1, y1))
                 else:
-                    rect = fitz.Rect(x0 / RENDER_SCALE, y0 / RENDER_SCALE, x1 / RENDER_SCALE, y1 / RENDER_SCALE)
-                    content = page.get_text("text", clip=rect)
-                out.append(
-                    {"page": pno, "class": r["c"], "x0": float(x0), "y0": float(y0), "x1": float(x1), "y1": float(y1),
-                     "conf": float(r["p"]), "content": content})
+                    crop = render_crop(page, fitz.Rect(x0, y0, x1, y1) / render_scale, render_scale)
+                content = writer.write(f"{rel}.png", crop)
+        else:
+            if banners:
+                banner = match_banner(fitz.Rect(r["x0"], r["y0"], r["x1"], r["y1"]) / render_scale, banners)
+            if banner is not None:
+                content = banner["text"]
+            else:
+                rect = fitz.Rect(x0 / render_scale, y0 / render_scale, x1 / render_scale, y1 / render_scale)
+                content = page.get_text("text", clip=rect)
+        rec = {"page": pno, "class": r["c"], "x0": float(x0 * k), "y0": float(y0 * k), "x1": float(x1 * k),
+               "y1": float(y1 * k), "conf": float(r["p"]), "content": content}
+        if banner is not None:
+            rec["banner"] = True
+        out.append(rec)
+    return out
+
+
+def get_yolo_output(pdf_name, pdf_path, output_path, image_writer=None, batch_size=BATCH_SIZE,
+                    render_scale=RENDER_SCALE, on_event=None, cancel=None, optimize=False, precision="fp32",
+                    compile_model=False, heavy_page_bytes=HEAVY_PAGE_BYTES, heavy_render_scale=HEAVY_RENDER_SCALE,
+                    max_pages=None, page_range=None, skip_references=False, stop_at_references=False, memory=None,
+                    render_workers=0, embedded_images=False, page_plan=None, weights_path=DEFAULT_WEIGHTS,
+                    strip_banners=False, tile_above=None, banners=None, embedded_links=None):
+    # page_plan: page numbers already planned by the caller (a shard of a split document); no planning here then.
+    # tile_above: pages whose longest side exceeds this many points are detected in tiles (predict_tiled).
+    # banners / embedded_links: banners learned by the caller and the EmbeddedImages xref → link store, so the
+    # ranges of a split document (PageShards) share one document's state.
+    model = get_model(weights_path, optimize=optimize, precision=precision, compile_model=compile_model)
+    writer = image_writer or DiskImageWriter(output_path)
+    batch_size = max(1, int(batch_size))
+    out = []
+    cnt = defaultdict(int)
+    with open_pdf(pdf_path) as doc:
+        if page_plan is not None:
+            plan = list(page_plan)
+        else:
+            plan = plan_pages(doc, max_pages=max_pages, page_range=page_range, skip_references=skip_references,
+                              stop_at_references=stop_at_references)
+        n_pages = len(plan)
+        if page_plan is None and n_pages < len(doc):
+            emit(on_event, "pages_skipped", doc=pdf_name, pages=len(doc), skipped=len(doc) - n_pages)
+        embedded = EmbeddedImages(doc, links=embedded_links) if embedded_images else None
+        if banners is None:
+            banners = learn_banners(doc, plan) if strip_banners else []
+            if banners:
+                emit(on_event, "banners", doc=pdf_name, banners=[b["text"][:80] for b in banners])
+        renderer = None
+        page_scales = {}
+        if render_workers and n_pages:
+            # Pages are queued to the render processes up front, so their scale is fixed here.
+            page_scales = {pno: page_render_scale(doc[pno - 1], render_scale, heavy_page_bytes, heavy_render_scale)
+                           for pno in plan if not is_oversized(doc[pno - 1], tile_above)}
+        if page_scales:
+            slot_bytes = max(frame_bytes(doc[pno - 1].rect, s) for pno, s in page_scales.items())
+            renderer = PageRenderPool(pdf_path, list(page_scales.items()), slot_bytes, workers=render_workers,
+                                      slots=render_workers + batch_size + 1)
+        try:
+            start = 0
+            while start < n_pages:
+                t0 = time.perf_counter()
+                # Under a memory budget the governor may shrink the batch and render scale of the next pages.
+                b, scale = batch_size, render_scale
+                if memory is not None:
+                    first = doc[plan[start] - 1]
+                    # A tiled page never holds more than tile-sized images.
+                    rect = fitz.Rect(0, 0, TILE_PTS, TILE_PTS) if is_oversized(first, tile_above) else first.rect
+                    b, scale = memory.fit(batch_size, render_scale, rect)
+                pnos = plan[start:start + b]
+                start += len(pnos)
+                pages, scales, ims = [], [], []
+                for pno in pnos:
+                    check_cancel(cancel)
+                    pages.append(doc[pno - 1])
+                    if pno in page_scales:
+                        scales.append(page_scales[pno])
+                        ims.append(renderer.frame(pno))
+                    else:
+                        scales.append(page_render_scale(pages[-1], scale, heavy_page_bytes, heavy_render_scale))
+                        ims.append(None if is_oversized(pages[-1], tile_above) else
+                                   render_page(pages[-1], scales[-1]))
+                if memory is not None:
+                    memory.sample("render")
+                whole = [i for i, im in enumerate(ims) if im is not None]
+                regs_list = [None] * len(ims)
+                if whole:
+                    for i, regs in zip(whole, predict_regions(model, [ims[i] for i in whole])):
+                        regs_list[i] = regs
+                for i, im in enumerate(ims):
+                    if im is None:
+                        regs_list[i] = predict_tiled(model, pages[i], scales[i], batch_size)
+                if memory is not None:
+                    memory.sample("predict")
+                for pno, page, page_scale, im, regs in zip(pnos, pages, scales, ims, regs_list):
+                    out += page_records(pdf_name, pno, page, im, regs, writer, cnt, render_scale=page_scale,
+                                        out_scale=render_scale, embedded=embedded, banners=banners)
+                del ims, im
+                if renderer is not None:
+                    for pno in pnos:
+                        renderer.release(pno)
+                if memory is not None:
+                    memory.sample("records")
+                dt = (time.perf_counter() - t0) / len(pnos)
+                for pno in pnos:
+                    emit(on_event, "page", doc=pdf_name, page=pno, pages=n_pages, seconds=dt)
+        finally:
+            if renderer is not None:
+                renderer.close()
+        if embedded is not None and embedded.matched:
+            emit(on_event, "embedded_images", doc=pdf_name, written=embedded.matched, reused=embedded.reused)
     return out
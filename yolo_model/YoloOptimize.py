@@ -0,0 +1,140 @@
+import argparse
+
+import fitz
+import torch
+from PIL import Image
+
+PRECISIONS = {"fp32", "bf16"}
+
+
+def bf16_supported():
+    # AVX512-BF16 / AMX capable CPUs; elsewhere autocast to bf16 is emulated and slower than fp32.
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def _to_float(y):
+    if torch.is_tensor(y):
+        return y.float()
+    if isinstance(y, (list, tuple)):
+        return type(y)(_to_float(v) for v in y)
+    return y
+
+
+def optimize_model(yolo, precision="fp32", compile_model=False, warmup_size=(1836, 2376), warmup_runs=2,
+                   channels_last=True):
+    """
+    Prepares a loaded YOLO for CPU inference in place: conv+bn fused, eval mode
+    without autograd, channels-last weights and inputs, inference_mode around
+    every forward, optional bf16 autocast and torch.compile. Finishes with a few
+    warmup predictions on a blank page (default: US Letter at 3x) so the first
+    real pages don't pay for predictor setup, oneDNN primitive creation or compilation.
+    channels_last=False keeps the weights where they are, e.g. memory-mapped from
+    safetensors and shared between processes (the conversion would copy every conv weight).
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {sorted(PRECISIONS)}")
+    if precision == "bf16" and not bf16_supported():
+        print("[WARN] CPU has no native bf16 support; using fp32.")
+        precision = "fp32"
+
+    net = yolo.model
+    net.fuse(verbose=False)
+    net.eval()
+    for p in net.parameters():
+        p.requires_grad_(False)
+    if channels_last:
+        net.to(memory_format=torch.channels_last)
+
+    forward = net.forward
+    if compile_model:
+        forward = torch.compile(forward, dynamic=True)
+
+    def fast_forward(x, *args, **kwargs):
+        if channels_last and torch.is_tensor(x):
+            x = x.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            if precision == "bf16":
+                with torch.autocast("cpu", dtype=torch.bfloat16):
+                    return _to_float(forward(x, *args, **kwargs))
+            return forward(x, *args, **kwargs)
+
+    net.forward = fast_forward
+
+    blank = Image.new("RGB", warmup_size, "white")
+    for _ in range(warmup_runs):
+        yolo.predict(blank, conf=0.40, iou=0.10, agnostic_nms=True, verbose=False)
+    return yolo
+
+
+def _match(base, cand, iou_t):
+    from .YoloModel import _iou
+
+    used = set()
+    matched = []
+    for a in base:
+        best, best_j = 0.0, None
+        for j, b in enumerate(cand):
+            if j in used or b["c"] != a["c"]:
+                continue
+            v = _iou((a["x0"], a["y0"], a["x1"], a["y1"]), (b["x0"], b["y0"], b["x1"], b["y1"]))
+            if v > best:
+                best, best_j = v, j
+        if best_j is not None and best >= iou_t:
+            used.add(best_j)
+            matched.append(abs(a["p"] - cand[best_j]["p"]))
+    return matched
+
+
+def check_parity(pdf_path, weights_path=None, precision="fp32", compile_model=False, max_pages=3,
+                 render_scale=3.0, iou_t=0.90, min_match=0.98):
+    """
+    Runs the first `max_pages` pages through a plain and an optimized model and
+    compares detections (same class, IoU >= iou_t). Returns a report dict; `ok`
+    is False when fewer than `min_match` of the detections (either side) match.
+    """
+    from ultralytics import YOLO
+    from .YoloModel import DEFAULT_WEIGHTS, predict_regions, render_page
+
+    weights_path = weights_path or DEFAULT_WEIGHTS
+    baseline = YOLO(weights_path)
+    optimized = optimize_model(YOLO(weights_path), precision=precision, compile_model=compile_model)
+
+    n_base = n_cand = 0
+    deltas = []
+    with fitz.open(pdf_path) as doc:
+        for page in list(doc)[:max_pages]:
+            im = render_page(page, render_scale)
+            base = predict_regions(baseline, [im])[0]
+            cand = predict_regions(optimized, [im])[0]
+            n_base += len(base)
+            n_cand += len(cand)
+            deltas += _match(base, cand, iou_t)
+
+    denom = max(n_base, n_cand, 1)
+    report = {
+        "baseline_boxes": n_base,
+        "optimized_boxes": n_cand,
+        "matched": len(deltas),
+        "match_rate": len(deltas) / denom,
+        "max_conf_delta": max(deltas, default=0.0),
+    }
+    report["ok"] = report["match_rate"] >= min_match
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare optimized vs baseline YOLO detections on a PDF")
+    parser.add_argument("pdf")
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--precision", choices=sorted(PRECISIONS), default="fp32")
+    parser.add_argument("--compile", action="store_true")
+    parser.add_argument("--pages", type=int, default=3)
+    args = parser.parse_args()
+
+    report = check_parity(args.pdf, args.weights, precision=args.precision, compile_model=args.compile,
+                          max_pages=args.pages)
+    print(report)
+    raise SystemExit(0 if report["ok"] else 1)
@@ -1,8 +1,20 @@
 from .YoloHelper import process_yolo_output
 from .YoloModel import get_yolo_output
+from .PageShards import SPLIT_PAGES, get_yolo_output_sharded
 
 
-def yolo_pipeline(pdf_name, pdf_path, image_output_path):
-    jsonl_data = get_yolo_output(pdf_name, pdf_path, image_output_path)
-    jsonl_data = process_yolo_output(jsonl_data)
+def yolo_pipeline(pdf_name, pdf_path, image_output_path, image_writer=None, return_detections=False, page_workers=0,
+                  split_pages=SPLIT_PAGES, **yolo_options):
+    if page_workers > 1:
+        # Long documents are split into page ranges detected by separate processes, merged in page order.
+        detections = get_yolo_output_sharded(pdf_name, pdf_path, image_output_path, image_writer=image_writer,
+                                             page_workers=page_workers, split_pages=split_pages, **yolo_options)
+    else:
+        detections = get_yolo_output(pdf_name, pdf_path, image_output_path, image_writer=image_writer,
+                                     **yolo_options)
+    # Repeated banners (strip_banners) stay in the detections but never reach post-processing or the filters.
+    jsonl_data = process_yolo_output([r for r in detections if not r.get("banner")])
+    # The raw detections (page, conf, boxes) are what --save-detections dumps and refilter.py starts from.
+    if return_detections:
+        return jsonl_data, detections
     return jsonl_data
@@ -0,0 +1,113 @@
+import argparse, json
+from pathlib import Path
+
+import torch
+
+from weights_utils import record_digest, weights_digest
+
+# Architecture config that ultralytics ships with; only used to build an empty YOLO wrapper.
+SHELL_CFG = "yolov8n.yaml"
+
+
+def convert_to_safetensors(pt_path, out_path=None):
+    """
+    Offline conversion of an ultralytics checkpoint into a safetensors file
+    that load_mmap_model() can map instead of unpickling. The network is fused
+    (conv+bn) and stored in fp32 exactly as inference uses it, so nothing has
+    to be rewritten after loading and the mapped pages stay shared. The
+    architecture, class names and predict overrides (imgsz, ...) go into the
+    safetensors metadata; a sha256 sidecar is written next to the file.
+    """
+    from safetensors.torch import save_file
+    from ultralytics import YOLO
+
+    out_path = Path(out_path or Path(pt_path).with_suffix(".safetensors"))
+    yolo = YOLO(str(pt_path))
+    net = yolo.model.float().fuse(verbose=False).eval()
+    state = {k: v.detach().contiguous() for k, v in net.state_dict().items()}
+    metadata = {
+        "format": "paper_reader.yolo.v1",
+        "yaml": json.dumps(net.yaml),
+        "names": json.dumps({int(k): v for k, v in net.names.items()}),
+        "overrides": json.dumps({k: v for k, v in yolo.overrides.items() if k != "model"}),
+        "source_sha256": weights_digest(pt_path),
+    }
+    save_file(state, str(out_path), metadata=metadata)
+    digest = record_digest(out_path)
+    print(f"[INFO] {pt_path} → {out_path} ({out_path.stat().st_size / 2**20:.0f} MB, sha256 {digest[:12]})")
+    return str(out_path)
+
+
+_DTYPES = {"F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16, "I64": torch.int64,
+           "I32": torch.int32, "U8": torch.uint8, "BOOL": torch.bool}
+
+
+def read_metadata(path):
+    # The safetensors header metadata only, without mapping the tensors.
+    with open(path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        return json.loads(f.read(header_len)).get("__metadata__", {}) or {}
+
+
+def converted_from(st_path, pt_path):
+    # True when the converted file was made from this checkpoint (or there is no other checkpoint to check).
+    pt_path = Path(pt_path)
+    if not pt_path.exists() or pt_path.resolve() == Path(st_path).resolve():
+        return True
+    return read_metadata(st_path).get("source_sha256") == weights_digest(pt_path)
+
+
+def map_safetensors(path):
+    # Tensors that view a private (copy-on-write) mapping of the file: every process mapping the same
+    # file shares its page-cache pages, and nothing is copied as long as the tensors are only read.
+    path = Path(path)
+    with open(path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    metadata = header.pop("__metadata__", {}) or {}
+    size = path.stat().st_size
+    storage = torch.UntypedStorage.from_file(str(path), False, size)
+    base = torch.empty(0, dtype=torch.uint8).set_(storage)
+    data_start = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        dtype = _DTYPES[info["dtype"]]
+        # safetensors orders tensors by alignment, so every view starts on a multiple of its item size.
+        raw = base[data_start + start:data_start + end]
+        tensors[name] = raw.view(dtype).reshape(info["shape"])
+    return tensors, metadata
+
+
+def load_mmap_model(path):
+    # A YOLO object whose DetectionModel parameters are views of the mapped safetensors file.
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import DetectionModel
+
+    weights_digest(path, strict=True)
+    tensors, metadata = map_safetensors(path)
+    if metadata.get("format") != "paper_reader.yolo.v1":
+        raise ValueError(f"{path} was not written by yolo_model.YoloWeights")
+
+    cfg = json.loads(metadata["yaml"])
+    net = DetectionModel(cfg, nc=cfg.get("nc"), verbose=False)
+    net.fuse(verbose=False)
+    net.load_state_dict(tensors, strict=True, assign=True)
+    net.names = {int(k): v for k, v in json.loads(metadata["names"]).items()}
+    net.eval()
+    for p in net.parameters():
+        p.requires_grad_(False)
+
+    yolo = YOLO(SHELL_CFG, task="detect")
+    yolo.model = net
+    yolo.overrides.update(json.loads(metadata.get("overrides", "{}")))
+    yolo.overrides["model"] = str(path)
+    return yolo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert YOLO weights to a memory-mappable safetensors file")
+    parser.add_argument("weights", help="ultralytics .pt checkpoint")
+    parser.add_argument("out", nargs="?", default=None, help="Output path (default: same name, .safetensors)")
+    args = parser.parse_args()
+    convert_to_safetensors(args.weights, args.out)